@@ -0,0 +1,236 @@
+"""
+Benchmarks for parsing, caching, fitting and plotting quench waveforms.
+
+Generates synthetic dumps with quench_synth at a few sizes, times each stage,
+and appends the results to a JSON file so runs from different versions can be
+compared.
+
+Example:
+    python bench_quench.py                       # default sizes, append to bench_results.json
+    python bench_quench.py --sizes 8x4x16384 --compare
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from quench_cache import cached_read_waveforms
+from quench_fit import fit_loaded_q, fit_loaded_q_batch
+from quench_parser import (
+    SIGNALS,
+    index_sections,
+    list_sections,
+    read_sections,
+    read_waveforms,
+)
+from quench_synth import write_dump
+
+# cavities x events x samples per waveform
+DEFAULT_SIZES = ["1x1x16384", "8x4x16384", "40x8x16384"]
+
+DEFAULT_RESULTS = "bench_results.json"
+
+
+def timed(func, repeat=3):
+    """
+    :return: (best wall time over repeat runs in seconds, result of the last run)
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def git_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def bench_size(n_cavities, n_events, n_samples, workdir, repeat=3, plot=True):
+    filename = os.path.join(workdir, f"bench_{n_cavities}x{n_events}x{n_samples}_QUENCH.txt")
+    truth = write_dump(
+        filename, n_cavities=n_cavities, n_events=n_events, n_samples=n_samples
+    )
+    keys = [
+        (f"{event['pv_prefix']}:{suffix}", event["timestamp"])
+        for event in truth
+        for suffix in SIGNALS.values()
+    ]
+    cache_dir = os.path.join(workdir, "cache")
+
+    results = {
+        "cavities": n_cavities,
+        "events": n_events,
+        "samples": n_samples,
+        "file_bytes": os.path.getsize(filename),
+    }
+
+    results["list_sections_s"], _ = timed(lambda: list_sections(filename), repeat)
+    # quiet, so printing every section is not part of the timings
+    results["parse_all_s"], _ = timed(
+        lambda: read_waveforms(filename, keys, verbose=False), repeat
+    )
+    # the index pass plus seeking to every section, as replay and read_events do
+    results["index_read_s"], _ = timed(
+        lambda: read_sections(filename, index_sections(filename), keys), repeat
+    )
+    # only the first cavity waveform, so early exit shows up
+    results["parse_first_s"], _ = timed(
+        lambda: read_waveforms(filename, keys[:1], verbose=False), repeat
+    )
+
+    def cold_cache():
+        for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+            os.remove(os.path.join(cache_dir, name))
+        return cached_read_waveforms(filename, keys, cache_dir=cache_dir, verbose=False)
+
+    results["cache_cold_s"], _ = timed(cold_cache, repeat)
+    results["cache_warm_s"], waveforms = timed(
+        lambda: cached_read_waveforms(filename, keys, cache_dir=cache_dir, verbose=False),
+        repeat,
+    )
+
+    time_waveforms = [
+        waveforms[(f"{event['pv_prefix']}:{SIGNALS['time']}", event["timestamp"])]
+        for event in truth
+    ]
+    fault_waveforms = [
+        waveforms[(f"{event['pv_prefix']}:{SIGNALS['cavity']}", event["timestamp"])]
+        for event in truth
+    ]
+    frequencies = [event["frequency"] for event in truth]
+
+    results["fit_each_s"], fits = timed(
+        lambda: [
+            fit_loaded_q(time_data, fault_data, frequency)
+            for time_data, fault_data, frequency in zip(
+                time_waveforms, fault_waveforms, frequencies
+            )
+        ],
+        repeat,
+    )
+    results["fit_batch_s"], (loaded_qs, _) = timed(
+        lambda: fit_loaded_q_batch(time_waveforms, fault_waveforms, frequencies), repeat
+    )
+
+    # sanity check the fits against the generated truth
+    true_qs = np.array([event["loaded_q"] for event in truth])
+    results["fit_max_rel_error"] = float(np.max(np.abs(loaded_qs / true_qs - 1)))
+    results["fit_each_matches_batch"] = bool(
+        np.allclose([fit[0] for fit in fits], loaded_qs)
+    )
+
+    if plot:
+        from quench_plot import QuenchPlotter
+
+        plotter = QuenchPlotter(headless=True)
+        event = truth[0]
+        signals = {
+            name: waveforms[(f"{event['pv_prefix']}:{suffix}", event["timestamp"])]
+            for name, suffix in SIGNALS.items()
+            if name != "time"
+        }
+        plot_filename = os.path.join(workdir, "bench_plot.png")
+
+        def plot():
+            plotter.plot_event(signals, "benchmark")
+            plotter.fig.savefig(plot_filename)
+
+        results["plot_s"], _ = timed(plot, repeat)
+        plotter.close()
+
+    return results
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(previous_run, current_run):
+    """
+    Print the ratio of every timing in current_run to the same size in previous_run.
+    """
+    previous = {
+        (r["cavities"], r["events"], r["samples"]): r for r in previous_run["results"]
+    }
+    print(f"\nCompared to {previous_run['version']} ({previous_run['date']}):")
+    for result in current_run["results"]:
+        size = (result["cavities"], result["events"], result["samples"])
+        if size not in previous:
+            continue
+        for name, value in result.items():
+            if name.endswith("_s") and name in previous[size]:
+                ratio = value / previous[size][name] if previous[size][name] else float("nan")
+                flag = "  <-- slower" if ratio > 1.2 else ""
+                print(f"  {'x'.join(map(str, size))} {name}: {ratio:.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the quench tools")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="cavities x events x samples, e.g. 8x4x16384",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-plot", action="store_true")
+    parser.add_argument("--results", default=DEFAULT_RESULTS)
+    parser.add_argument("--compare", action="store_true", help="compare with the last stored run")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    run = {
+        "version": git_version(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            n_cavities, n_events, n_samples = map(int, size.split("x"))
+            print(f"Benchmarking {size}")
+            result = bench_size(
+                n_cavities, n_events, n_samples, workdir, args.repeat, not args.no_plot
+            )
+            for name, value in result.items():
+                if name.endswith("_s"):
+                    print(f"  {name}: {value * 1000:.2f} ms")
+            print(f"  fit_max_rel_error: {result['fit_max_rel_error']:.2e}")
+            run["results"].append(result)
+
+    history = load_results(args.results)
+    if args.compare and history:
+        compare(history[-1], run)
+
+    if not args.no_save:
+        history.append(run)
+        with open(args.results, "w") as file:
+            json.dump(history, file, indent=2)
+        print(f"Results saved to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
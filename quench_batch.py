@@ -0,0 +1,227 @@
+"""
+Batch triage of QUENCH dump files.
+
+Example:
+    python quench_batch.py /data/faults/ --workers 8 --output-dir triage/
+    python quench_batch.py "/data/faults/ACCL_L3B_*_QUENCH.txt" --no-plot
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from quench_fit import cavity_frequency, fit_loaded_q
+from quench_parser import SIGNALS, index_sections, read_sections
+
+# e.g. ACCL_L3B_3180_20220630_164905_QUENCH.txt -> L3B, CM31, cavity 8
+QUENCH_FILENAME = re.compile(
+    r"ACCL_(?P<linac>L\dB)_(?P<cm>\w{2})(?P<cav>\d)0_"
+    r"(?P<date>\d{8})_(?P<time>\d{6})_QUENCH\.txt$"
+)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def parse_filename(filename):
+    """
+    Work out the cavity and the (second resolution) fault time from a dump file name.
+
+    :param filename: path or name like ACCL_L3B_3180_20220630_164905_QUENCH.txt
+    :return: dict with linac, cryomodule, cavity, pv_prefix and timestamp_prefix
+    """
+    match = QUENCH_FILENAME.search(os.path.basename(filename))
+    if not match:
+        raise ValueError(f"Unrecognized QUENCH file name: {filename}")
+
+    fault_time = datetime.datetime.strptime(
+        match["date"] + match["time"], "%Y%m%d%H%M%S"
+    )
+    return {
+        "linac": match["linac"],
+        "cryomodule": match["cm"],
+        "cavity": int(match["cav"]),
+        "pv_prefix": f"ACCL:{match['linac']}:{match['cm']}{match['cav']}0",
+        # the dump timestamps carry microseconds, the file name stops at seconds
+        "timestamp_prefix": fault_time.strftime("%Y-%m-%d_%H:%M:%S"),
+    }
+
+
+def find_timestamp(filename, cavity_pv, timestamp_prefix, index=None):
+    """
+    Find the exact waveform timestamp in the dump that matches the file name.
+
+    Falls back to the first cavity waveform in the file if none match.
+
+    :param index: index_sections of the file, built here if not given
+    """
+    if index is None:
+        index = index_sections(filename)
+    timestamps = [ts for pv, ts in index if pv == cavity_pv]
+    for timestamp in timestamps:
+        if timestamp.startswith(timestamp_prefix):
+            return timestamp
+    if timestamps:
+        print(f"No {cavity_pv} waveform at {timestamp_prefix}, using {timestamps[0]}")
+        return timestamps[0]
+    return None
+
+
+# one plotter per worker process so the figure is reused between files
+_plotter = None
+
+
+def plot_waveforms(waveforms, title, plot_filename):
+    global _plotter
+    if _plotter is None:
+        # imported here so workers only pay for matplotlib when plotting
+        from quench_plot import QuenchPlotter
+
+        _plotter = QuenchPlotter(headless=True)
+
+    _plotter.plot_event(
+        {name: waveforms[name] for name in ("cavity", "forward", "reverse", "decay")},
+        title,
+    )
+    _plotter.save(plot_filename)
+
+
+def process_file(filename, output_dir, plot=True):
+    """
+    Parse, plot and fit a single QUENCH dump.
+
+    Runs in a worker process, so every failure is caught and reported in the
+    returned result instead of taking down the whole batch.
+
+    :return: dict describing the file, suitable for the manifest
+    """
+    result = {"file": os.path.abspath(filename)}
+    try:
+        details = parse_filename(filename)
+        result.update(details)
+
+        # one pass over the dump, the waveforms are then read by seeking
+        index = index_sections(filename)
+        cavity_pv = f"{details['pv_prefix']}:{SIGNALS['cavity']}"
+        timestamp = find_timestamp(
+            filename, cavity_pv, details["timestamp_prefix"], index
+        )
+        if timestamp is None:
+            raise ValueError(f"No {cavity_pv} waveform in file")
+        result["timestamp"] = timestamp
+
+        keys = {
+            name: (f"{details['pv_prefix']}:{suffix}", timestamp)
+            for name, suffix in SIGNALS.items()
+        }
+        found = read_sections(filename, index, keys.values())
+        waveforms = {name: found[key] for name, key in keys.items()}
+        result["points"] = {name: len(data) for name, data in waveforms.items()}
+
+        cavity_data = waveforms["cavity"]
+        if cavity_data.size:
+            result["amp_min"] = float(np.min(cavity_data))
+            result["amp_max"] = float(np.max(cavity_data))
+
+        # the fit needs the fault time waveform, which not every dump carries
+        if waveforms["time"].size and cavity_data.size:
+            loaded_q, pre_quench_amp = fit_loaded_q(
+                waveforms["time"],
+                cavity_data,
+                cavity_frequency(details["cryomodule"]),
+            )
+            result["loaded_q"] = float(loaded_q)
+            result["pre_quench_amp"] = float(pre_quench_amp)
+
+        if plot and cavity_data.size:
+            plot_filename = os.path.join(
+                output_dir,
+                f"combined_{os.path.basename(filename).replace('.txt', '')}.png",
+            )
+            plot_waveforms(
+                waveforms, f"Quench Waveforms - {cavity_pv} {timestamp}", plot_filename
+            )
+            result["plot"] = plot_filename
+
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def find_files(paths, pattern="*_QUENCH.txt"):
+    """
+    Expand directories and glob patterns into a sorted list of dump files.
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(glob.glob(os.path.join(path, pattern)))
+        else:
+            files.update(p for p in glob.glob(path) if os.path.isfile(p))
+    return sorted(files)
+
+
+def run_batch(paths, output_dir, workers=None, plot=True, pattern="*_QUENCH.txt"):
+    """
+    Process every matching dump file over a process pool and write the manifest.
+
+    :param paths: directories, files or glob patterns
+    :param output_dir: where plots and the manifest go
+    :param workers: number of worker processes (None lets the pool decide)
+    :return: list of per-file results, in file order
+    """
+    files = find_files(paths, pattern)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Processing {len(files)} files with {workers or os.cpu_count()} workers")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_file, filename, output_dir, plot): filename
+            for filename in files
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            print(f"{result['status']}: {os.path.basename(futures[future])}")
+
+    ordered = [results[filename] for filename in files]
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path, "w") as file:
+        json.dump(ordered, file, indent=2)
+    print(f"Manifest saved as: {manifest_path}")
+
+    return ordered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch process *_QUENCH.txt fault dumps")
+    parser.add_argument("paths", nargs="+", help="directories, files or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="quench_batch_output")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--pattern", default="*_QUENCH.txt")
+    parser.add_argument("--no-plot", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run_batch(
+        args.paths,
+        args.output_dir,
+        workers=args.workers,
+        plot=not args.no_plot,
+        pattern=args.pattern,
+    )
+    errors = sum(result["status"] != "ok" for result in results)
+    print(f"{len(results) - errors} ok, {errors} failed")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
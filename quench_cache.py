@@ -0,0 +1,145 @@
+"""
+Binary cache of parsed waveforms so repeat analyses skip the text parse.
+
+Each dump file gets one uncompressed .npz holding its parsed sections in
+columnar form: all samples concatenated into one float64 array, with offsets,
+PV names and timestamps alongside. The cache file name carries a key built
+from the source path, size and mtime (optionally a content hash), so editing
+or replacing the dump automatically invalidates it.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from quench_parser import read_waveforms
+
+CACHE_DIR_NAME = ".quench_cache"
+KEY_LENGTH = 16
+
+
+def cache_key(filename, use_hash: bool = False) -> str:
+    """
+    :param use_hash: also hash the file contents, for filesystems where mtime
+        cannot be trusted. Much slower on multi-GB dumps.
+    """
+    stat = os.stat(filename)
+    key = hashlib.sha1(
+        f"{os.path.abspath(filename)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+    )
+    if use_hash:
+        with open(filename, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                key.update(chunk)
+    return key.hexdigest()[:KEY_LENGTH]
+
+
+def cache_path(filename, cache_dir=None, use_hash: bool = False) -> str:
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.path.dirname(os.path.abspath(filename)), CACHE_DIR_NAME
+        )
+    name = os.path.basename(filename)
+    return os.path.join(cache_dir, f"{name}.{cache_key(filename, use_hash)}.npz")
+
+
+def load_cache(path):
+    """
+    :return: (waveforms, absent) where waveforms maps (pv, timestamp) -> ndarray
+        and absent is the set of keys known not to be in the dump
+    """
+    if not os.path.exists(path):
+        return {}, set()
+
+    with np.load(path) as cached:
+        samples = cached["samples"]
+        offsets = cached["offsets"]
+        waveforms = {
+            (str(pv), str(timestamp)): samples[offsets[idx] : offsets[idx + 1]]
+            for idx, (pv, timestamp) in enumerate(
+                zip(cached["pvs"], cached["timestamps"])
+            )
+        }
+        absent = set(
+            zip(map(str, cached["absent_pvs"]), map(str, cached["absent_timestamps"]))
+        )
+    return waveforms, absent
+
+
+def save_cache(path, waveforms, absent=()):
+    keys = list(waveforms)
+    lengths = [len(waveforms[key]) for key in keys]
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    absent = sorted(absent)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # drop caches left behind by older versions of the same dump
+    source_prefix = glob.escape(path.rsplit(".", 2)[0])
+    for stale in glob.glob(f"{source_prefix}.{'?' * KEY_LENGTH}.npz"):
+        if stale != path:
+            os.remove(stale)
+
+    # write next to the target and rename so readers never see half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(
+            file,
+            samples=(
+                np.concatenate([waveforms[key] for key in keys])
+                if keys
+                else np.empty(0, dtype=np.float64)
+            ),
+            offsets=offsets,
+            pvs=np.array([pv for pv, _ in keys], dtype=str),
+            timestamps=np.array([timestamp for _, timestamp in keys], dtype=str),
+            absent_pvs=np.array([pv for pv, _ in absent], dtype=str),
+            absent_timestamps=np.array([timestamp for _, timestamp in absent], dtype=str),
+        )
+    os.replace(tmp_path, path)
+
+
+def cached_read_waveforms(
+    filename, keys, cache_dir=None, use_hash: bool = False, verbose: bool = True
+):
+    """
+    Drop in replacement for quench_parser.read_waveforms that goes through the cache.
+
+    Only sections missing from the cache are parsed from the text file, and
+    they are added to the cache for next time. When the cache cannot be
+    written (e.g. next to a dump in a read-only archive) the parsed waveforms
+    are still returned.
+
+    :param filename: path to a QUENCH dump file
+    :param keys: iterable of (pv, timestamp) pairs to extract
+    :param cache_dir: where to keep cache files, defaults to .quench_cache next to the dump
+    :param verbose: print cache hits and misses and each section parsed
+    :return: dict mapping (pv, timestamp) -> float64 ndarray (empty if not found)
+    """
+    keys = list(keys)
+    path = cache_path(filename, cache_dir, use_hash)
+    waveforms, absent = load_cache(path)
+
+    missing = [key for key in keys if key not in waveforms and key not in absent]
+    if missing:
+        if verbose:
+            print(f"Parsing {len(missing)} waveforms missing from cache {path}")
+        parsed = read_waveforms(filename, missing, verbose=verbose)
+        for key, data in parsed.items():
+            if data.size:
+                waveforms[key] = data
+            else:
+                absent.add(key)
+        try:
+            save_cache(path, waveforms, absent)
+        except OSError as e:
+            print(f"Could not write cache {path}: {e}")
+    elif verbose:
+        print(f"Loaded {len(keys)} waveforms from cache {path}")
+
+    return {
+        key: waveforms.get(key, np.empty(0, dtype=np.float64)) for key in keys
+    }
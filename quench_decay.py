@@ -0,0 +1,158 @@
+"""
+Score cavity decays against the cavity's normal decay reference (DECAYREFWF).
+
+The reference is recorded on the same fault time axis as CAV:FLTAWF, so the
+two are aligned sample for sample over the cavity's decay window (time 0 to
+where the amplitude drops below DECAY_END_AMP), taken from
+quench_fit.decay_windows so it is the same window the loaded Q fit uses. Both
+are normalized to their amplitude at time 0, then for every event:
+
+- residual: RMS difference of the normalized decays
+- correlation: Pearson correlation of the normalized decays
+- rate_ratio: decay rate of the cavity over the decay rate of the reference,
+  from closed form slopes of ln(A). This is saved Q / loaded Q, so a real
+  quench has rate_ratio above 1 / LOADED_Q_CHANGE_FOR_QUENCH.
+
+Everything runs on NaN padded (n_events, n_samples) arrays, in chunks of
+SCORE_CHUNK_SIZE rows to bound memory, so whole archives score in one call.
+"""
+
+import numpy as np
+
+from quench_fit import LOADED_Q_CHANGE_FOR_QUENCH, decay_windows, pad_waveforms
+
+# rows scored at once, a 256 x 16384 chunk keeps the temporaries around 30 MB
+SCORE_CHUNK_SIZE = 256
+
+
+def _score_chunk(time_data, fault_data, reference_data, lengths):
+    n_rows, n_cols = fault_data.shape
+    columns = np.arange(n_cols)
+    time_0, stop = decay_windows(time_data, fault_data, lengths)
+
+    rows = np.arange(n_rows)
+    fault_0 = fault_data[rows, np.minimum(time_0, n_cols - 1)]
+    reference_0 = reference_data[rows, np.minimum(time_0, n_cols - 1)]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        in_decay = (
+            (columns >= time_0[:, None])
+            & (columns < stop[:, None])
+            & (fault_data > 0)
+            & (reference_data > 0)
+        )
+        n_points = in_decay.sum(axis=1)
+
+        fault_norm = np.where(in_decay, fault_data / fault_0[:, None], 0)
+        reference_norm = np.where(in_decay, reference_data / reference_0[:, None], 0)
+
+        difference = fault_norm - reference_norm
+        residual = np.sqrt((difference**2).sum(axis=1) / n_points)
+
+        fault_centered = np.where(
+            in_decay, fault_norm - (fault_norm.sum(axis=1) / n_points)[:, None], 0
+        )
+        reference_centered = np.where(
+            in_decay,
+            reference_norm - (reference_norm.sum(axis=1) / n_points)[:, None],
+            0,
+        )
+        correlation = (fault_centered * reference_centered).sum(axis=1) / np.sqrt(
+            (fault_centered**2).sum(axis=1) * (reference_centered**2).sum(axis=1)
+        )
+
+        # ratio of the ln(A) slopes, the shared time centering cancels out
+        time_mean = np.where(in_decay, time_data, 0).sum(axis=1) / n_points
+        time_centered = np.where(in_decay, time_data - time_mean[:, None], 0)
+        fault_slope = (time_centered * np.log(np.where(in_decay, fault_data, 1))).sum(
+            axis=1
+        )
+        reference_slope = (
+            time_centered * np.log(np.where(in_decay, reference_data, 1))
+        ).sum(axis=1)
+        rate_ratio = fault_slope / reference_slope
+
+    enough = n_points >= 2
+    return {
+        "residual": np.where(enough, residual, np.nan),
+        "correlation": np.where(enough, correlation, np.nan),
+        "rate_ratio": np.where(enough, rate_ratio, np.nan),
+        "n_points": n_points,
+    }
+
+
+def score_decays(
+    time_data, fault_data, reference_data, lengths=None, chunk_size=SCORE_CHUNK_SIZE
+):
+    """
+    Score many decays against their references at once.
+
+    :param time_data: (n_events, n_samples) fault time arrays, NaN padded, or a
+        sequence of 1-D waveforms
+    :param fault_data: CAV:FLTAWF arrays, same layout
+    :param reference_data: DECAYREFWF arrays, same layout
+    :param lengths: samples per row, worked out from the waveforms if not given
+    :return: dict of "residual", "correlation", "rate_ratio", "n_points" arrays,
+        NaN where there were fewer than two usable decay samples (including
+        every row when no event has a reference)
+    """
+    if lengths is None:
+        time_data, time_lengths = pad_waveforms(time_data)
+        fault_data, fault_lengths = pad_waveforms(fault_data)
+        reference_data, reference_lengths = pad_waveforms(reference_data)
+        lengths = np.minimum(np.minimum(time_lengths, fault_lengths), reference_lengths)
+
+    n_cols = min(time_data.shape[1], fault_data.shape[1], reference_data.shape[1])
+    lengths = np.minimum(np.asarray(lengths), n_cols)
+    if n_cols == 0:
+        # e.g. a dump without DECAYREFWF, there is nothing to score against
+        return {
+            "residual": np.full(len(lengths), np.nan),
+            "correlation": np.full(len(lengths), np.nan),
+            "rate_ratio": np.full(len(lengths), np.nan),
+            "n_points": np.zeros(len(lengths), dtype=np.intp),
+        }
+
+    chunks = [
+        _score_chunk(
+            time_data[start : start + chunk_size, :n_cols],
+            fault_data[start : start + chunk_size, :n_cols],
+            reference_data[start : start + chunk_size, :n_cols],
+            lengths[start : start + chunk_size],
+        )
+        for start in range(0, len(lengths), chunk_size)
+    ]
+    if not chunks:
+        return {
+            name: np.empty(0)
+            for name in ("residual", "correlation", "rate_ratio", "n_points")
+        }
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]
+    }
+
+
+def score_events(events, chunk_size=SCORE_CHUNK_SIZE):
+    """
+    Score every event from quench_events.read_events.
+    """
+    lengths = np.minimum(
+        np.minimum(events["lengths"]["time"], events["lengths"]["cavity"]),
+        events["lengths"]["decay"],
+    )
+    return score_decays(
+        events["signals"]["time"],
+        events["signals"]["cavity"],
+        events["signals"]["decay"],
+        lengths,
+        chunk_size,
+    )
+
+
+def is_real_by_decay(rate_ratio, threshold=LOADED_Q_CHANGE_FOR_QUENCH):
+    """
+    Decay-shape verdict matching is_real_quench: real when the cavity decayed
+    more than 1 / threshold times faster than its reference. A NaN ratio
+    counts as real so it is never reset automatically.
+    """
+    return ~(np.asarray(rate_ratio) <= 1 / threshold)
@@ -0,0 +1,111 @@
+"""
+Every fault event in a QUENCH dump as stacked arrays.
+
+read_events finds each (cavity, timestamp) pair in a dump on its own, so no
+timestamp has to be copied out of the file by hand, and returns one
+(n_events, n_samples) array per signal with the event metadata alongside.
+Rows are NaN padded to the longest waveform of that signal; lengths holds
+the real number of samples per row.
+
+Example:
+    events = read_events("ACCL_L3B_3180_20220630_164905_QUENCH.txt")
+    loaded_qs, pre_quench_amps = fit_events(events)
+"""
+
+import os
+
+import numpy as np
+
+from quench_fit import cavity_frequency, fit_loaded_q_batch, pad_waveforms
+from quench_parser import (
+    SIGNALS,
+    cavity_location,
+    index_sections,
+    read_sections,
+    split_pv,
+)
+
+
+def read_events(filename, signals=None):
+    """
+    Read every fault event in a dump.
+
+    :param signals: dict of signal name -> PV suffix, defaults to quench_parser.SIGNALS
+    :return: dict with
+        "file": absolute path,
+        "pv_prefix", "timestamp", "linac", "cryomodule", "cavity": lists, one
+            entry per event in file order,
+        "frequency": float64 array of cavity frequencies,
+        "signals": dict of signal name -> NaN padded (n_events, n_samples) array,
+        "lengths": dict of signal name -> samples per row
+    """
+    signals = signals or SIGNALS
+    names = {suffix: name for name, suffix in signals.items()}
+
+    # index without decoding, then seek to only the signals asked for
+    index = index_sections(filename)
+    events = {}
+    keys = []
+    for pv, timestamp in index:
+        pv_prefix, suffix = split_pv(pv)
+        if suffix not in names:
+            continue
+        keys.append((pv, timestamp))
+        # a dict keeps the first-seen order without a linear search
+        events.setdefault((pv_prefix, timestamp), None)
+    events = list(events)
+
+    waveforms = read_sections(filename, index, keys)
+
+    stacked = {}
+    lengths = {}
+    for name, suffix in signals.items():
+        stacked[name], lengths[name] = pad_waveforms(
+            [
+                waveforms.get(
+                    (f"{pv_prefix}:{suffix}", timestamp), np.empty(0, dtype=np.float64)
+                )
+                for pv_prefix, timestamp in events
+            ]
+        )
+
+    locations = [cavity_location(pv_prefix) for pv_prefix, _ in events]
+    cryomodules = [cryomodule for _, cryomodule, _ in locations]
+
+    return {
+        "file": os.path.abspath(filename),
+        "pv_prefix": [pv_prefix for pv_prefix, _ in events],
+        "timestamp": [timestamp for _, timestamp in events],
+        "linac": [linac for linac, _, _ in locations],
+        "cryomodule": cryomodules,
+        "cavity": [cavity for _, _, cavity in locations],
+        "frequency": np.array(
+            [cavity_frequency(cryomodule) for cryomodule in cryomodules], dtype=float
+        ),
+        "signals": stacked,
+        "lengths": lengths,
+    }
+
+
+def event_waveforms(events, name):
+    """
+    :return: list of the real (unpadded) samples of signal name for every event
+    """
+    return [
+        row[:length]
+        for row, length in zip(events["signals"][name], events["lengths"][name])
+    ]
+
+
+def fit_events(events, fault_signal="cavity", time_signal="time"):
+    """
+    Fit the loaded Q of every event with fit_loaded_q_batch.
+
+    :return: (loaded Q array, pre-quench amplitude array), NaN where an event
+        could not be fit
+    """
+    return fit_loaded_q_batch(
+        event_waveforms(events, time_signal),
+        event_waveforms(events, fault_signal),
+        events["frequency"],
+    )
@@ -0,0 +1,176 @@
+import numpy as np
+
+try:
+    # the live threshold, so offline replays and triage agree with validate_quench
+    from applications.quench_processing.quench_utils import LOADED_Q_CHANGE_FOR_QUENCH
+except ImportError:
+    # fraction of the saved loaded Q below which a quench is considered real,
+    # copied from quench_utils for machines without the linac packages
+    LOADED_Q_CHANGE_FOR_QUENCH = 0.6
+
+# amplitude (MV) treated as the end of the decay
+DECAY_END_AMP = 0.002
+
+
+def cavity_frequency(cryomodule_name):
+    # harmonic linearizer cavities run at 3.9 GHz, everything else at 1.3 GHz
+    return 3.9e9 if str(cryomodule_name).startswith("H") else 1.3e9
+
+
+def decay_window(time_data, fault_data):
+    """
+    Find the slice of the fault waveform between the quench and the end of the decay.
+
+    Time 0 is the first sample with a non-negative timestamp (these waveforms
+    capture data beforehand) and the decay ends at the first sample after that
+    below DECAY_END_AMP. Both are found with argmax on boolean masks, so no
+    Python loop runs over the samples.
+
+    :return: (start, stop) indices into the original arrays
+    """
+    after_quench = time_data >= 0
+    if after_quench.any():
+        time_0 = int(np.argmax(after_quench))
+    else:
+        time_0 = max(len(time_data) - 1, 0)
+
+    decayed = fault_data[time_0:] < DECAY_END_AMP
+    if decayed.any():
+        end_decay = int(np.argmax(decayed))
+    else:
+        end_decay = len(decayed) - 1
+
+    return time_0, time_0 + max(end_decay, 0)
+
+
+def decay_slope(time_data, fault_data):
+    """
+    Closed form least squares slope of ln(A0 / A(t)) against t.
+
+    ln(A0) is constant, so the slope of ln(A0 / A(t)) is minus the slope of
+    ln(A(t)) and A0 never needs to be divided out.
+    """
+    time_centered = time_data - time_data.mean()
+    log_amp = np.log(fault_data)
+    return -np.dot(time_centered, log_amp) / np.dot(time_centered, time_centered)
+
+
+def fit_loaded_q(time_data, fault_data, frequency):
+    """
+    Fit the decay of a fault waveform to get the loaded Q.
+
+    A(t) = A0 * e^((-pi * cav_freq * t)/loaded_Q), so the slope of ln(A0/A(t))
+    against t is (pi * cav_freq)/loaded_Q.
+
+    :param time_data: fault time waveform (s), negative before the quench
+    :param fault_data: fault amplitude waveform (MV)
+    :param frequency: cavity frequency (Hz)
+    :return: (loaded_q, pre_quench_amp)
+    """
+    time_data = np.asarray(time_data, dtype=np.float64)
+    fault_data = np.asarray(fault_data, dtype=np.float64)
+
+    start, stop = decay_window(time_data, fault_data)
+    if stop - start < 2:
+        raise ValueError(f"Only {stop - start} samples in the decay, cannot fit")
+
+    # views into the original arrays, nothing is copied here
+    fault_data = fault_data[start:stop]
+    time_data = time_data[start:stop]
+
+    pre_quench_amp = fault_data[0]
+    loaded_q = (np.pi * frequency) / decay_slope(time_data, fault_data)
+
+    return loaded_q, pre_quench_amp
+
+
+def is_real_quench(loaded_q, saved_loaded_q, threshold=LOADED_Q_CHANGE_FOR_QUENCH):
+    """
+    A quench is real when the loaded Q dropped below threshold * saved loaded Q.
+    Works on scalars or arrays; a NaN loaded Q (decay that could not be fit)
+    counts as real so it is never reset automatically.
+    """
+    return ~(np.asarray(loaded_q) >= threshold * np.asarray(saved_loaded_q))
+
+
+def _as_waveform(waveform):
+    # a disconnected PV reads as None, which is treated as an empty waveform
+    if waveform is None:
+        return np.empty(0, dtype=np.float64)
+    return np.asarray(waveform, dtype=np.float64)
+
+
+def pad_waveforms(waveforms):
+    """
+    Stack waveforms of different lengths into one NaN padded 2-D array.
+
+    :param waveforms: sequence of 1-D waveforms, None counts as empty
+    :return: (padded array of shape (n_waveforms, max_length), lengths)
+    """
+    waveforms = [_as_waveform(waveform) for waveform in waveforms]
+    lengths = np.array([len(waveform) for waveform in waveforms], dtype=np.intp)
+    padded = np.full((len(waveforms), lengths.max(initial=0)), np.nan)
+    for row, waveform in enumerate(waveforms):
+        padded[row, : lengths[row]] = waveform
+    return padded, lengths
+
+
+def decay_windows(time_data, fault_data, lengths):
+    """
+    decay_window for every row of NaN padded arrays, so batched classifiers
+    (quench_decay) fit over exactly the window fit_loaded_q does.
+
+    :param time_data: (n_rows, n_samples) fault time arrays
+    :param fault_data: (n_rows, n_samples) fault amplitude arrays
+    :param lengths: real samples per row
+    :return: (time_0, stop) int arrays, both 0 for empty rows
+    """
+    time_0 = np.zeros(len(lengths), dtype=np.intp)
+    stop = np.zeros(len(lengths), dtype=np.intp)
+    for row, length in enumerate(lengths):
+        if length:
+            time_0[row], stop[row] = decay_window(
+                time_data[row, :length], fault_data[row, :length]
+            )
+    return time_0, stop
+
+
+def fit_loaded_q_batch(time_waveforms, fault_waveforms, frequencies):
+    """
+    Fit the loaded Q of many cavities at once.
+
+    Every row gets the same decay_window and closed form slope as
+    fit_loaded_q. Both passes over a row run back to back while its samples
+    are still in cache, which is several times faster than one 2-D pass over
+    NaN padded arrays, whose temporaries span the widest row. Rows that do not
+    have at least two samples in the decay, including empty or None ones,
+    come back as NaN.
+
+    :param time_waveforms: sequence of fault time waveforms (s), None if missing
+    :param fault_waveforms: sequence of fault amplitude waveforms (MV), None if
+        missing
+    :param frequencies: cavity frequency per row (Hz), or one for all
+    :return: (loaded_q, pre_quench_amp) arrays with one entry per cavity
+    """
+    time_waveforms = [_as_waveform(waveform) for waveform in time_waveforms]
+    fault_waveforms = [_as_waveform(waveform) for waveform in fault_waveforms]
+    n_rows = len(time_waveforms)
+    frequencies = np.broadcast_to(np.asarray(frequencies, dtype=np.float64), (n_rows,))
+
+    loaded_q = np.full(n_rows, np.nan)
+    pre_quench_amp = np.full(n_rows, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for row, (time_data, fault_data) in enumerate(
+            zip(time_waveforms, fault_waveforms)
+        ):
+            length = min(len(time_data), len(fault_data))
+            if length == 0:
+                continue
+            start, stop = decay_window(time_data[:length], fault_data[:length])
+            pre_quench_amp[row] = fault_data[start]
+            if stop - start >= 2:
+                slope = decay_slope(time_data[start:stop], fault_data[start:stop])
+                loaded_q[row] = (np.pi * frequencies[row]) / slope
+
+    return loaded_q, pre_quench_amp
@@ -0,0 +1,285 @@
+"""
+Per-cavity history of validated quenches.
+
+Every validate_quench result is appended as one fixed-width binary record to
+<root>/<cavity>.events, so the loaded Q trend of a cavity (or of the whole
+machine) is a single np.fromfile per cavity instead of a search through
+months of log text. The fault waveforms can optionally be kept too, in a
+ring of fixed-size slots in <root>/<cavity>.waveforms holding only the last
+waveform_slots events.
+
+Event files are trimmed back to max_events records once they reach twice
+that, so appends stay O(1) and files stay bounded.
+
+Example:
+    python quench_history.py /data/quench_history --trend ACCL:L1B:0210 -n 20
+    python quench_history.py /data/quench_history --degrading
+"""
+
+import argparse
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+EVENT_SUFFIX = ".events"
+WAVEFORM_SUFFIX = ".waveforms"
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),  # unix time the event was validated
+        ("seq", "<i8"),  # event number for this cavity, never reused
+        ("loaded_q", "<f8"),
+        ("saved_loaded_q", "<f8"),
+        ("threshold", "<f8"),
+        ("pre_quench_amp", "<f8"),
+        ("is_real", "i1"),
+    ]
+)
+
+# records kept per cavity after trimming
+MAX_EVENTS = 10000
+
+# waveform ring slots per cavity and samples stored per waveform
+WAVEFORM_SLOTS = 32
+WAVEFORM_SAMPLES = 16384
+
+# seq, number of samples, then time and fault waveforms
+SLOT_HEADER_DTYPE = np.dtype([("seq", "<i8"), ("n_samples", "<i8")])
+
+
+def history_key(cavity) -> str:
+    """
+    :param cavity: QuenchCavity or PV prefix string such as ACCL:L1B:0210
+    """
+    if isinstance(cavity, str):
+        return cavity.rstrip(":")
+    return cavity.pv_prefix.rstrip(":")
+
+
+class QuenchHistory:
+    def __init__(
+        self,
+        root,
+        max_events=MAX_EVENTS,
+        waveform_slots=WAVEFORM_SLOTS,
+        waveform_samples=WAVEFORM_SAMPLES,
+    ):
+        """
+        :param waveform_slots: 0 to not keep waveforms
+        """
+        self.root = root
+        self.max_events = max_events
+        self.waveform_slots = waveform_slots
+        self.waveform_samples = waveform_samples
+        self.slot_bytes = SLOT_HEADER_DTYPE.itemsize + 2 * waveform_samples * 4
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, suffix) -> str:
+        return os.path.join(self.root, key.replace(":", "_") + suffix)
+
+    def _next_seq(self, path) -> int:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < RECORD_DTYPE.itemsize:
+            return 0
+        with open(path, "rb") as file:
+            file.seek(size - size % RECORD_DTYPE.itemsize - RECORD_DTYPE.itemsize)
+            last = np.frombuffer(file.read(RECORD_DTYPE.itemsize), dtype=RECORD_DTYPE)
+        return int(last["seq"][0]) + 1
+
+    def append(
+        self,
+        cavity,
+        loaded_q,
+        saved_loaded_q,
+        threshold,
+        pre_quench_amp,
+        is_real,
+        time_data=None,
+        fault_data=None,
+        timestamp=None,
+    ) -> int:
+        """
+        Record one validated quench.
+
+        :param time_data: fault time waveform, stored with fault_data if given
+            and the store keeps waveforms
+        :return: the event's sequence number
+        """
+        key = history_key(cavity)
+        path = self._path(key, EVENT_SUFFIX)
+
+        with self._lock:
+            seq = self._next_seq(path)
+            record = np.zeros(1, dtype=RECORD_DTYPE)
+            record["time"] = time.time() if timestamp is None else timestamp
+            record["seq"] = seq
+            record["loaded_q"] = loaded_q
+            record["saved_loaded_q"] = saved_loaded_q
+            record["threshold"] = threshold
+            record["pre_quench_amp"] = pre_quench_amp
+            record["is_real"] = bool(is_real)
+
+            with open(path, "ab") as file:
+                file.write(record.tobytes())
+
+            if self.waveform_slots and time_data is not None and fault_data is not None:
+                self._write_waveforms(key, seq, time_data, fault_data)
+
+            if os.path.getsize(path) >= 2 * self.max_events * RECORD_DTYPE.itemsize:
+                self._trim(path)
+
+        return seq
+
+    def _write_waveforms(self, key, seq, time_data, fault_data):
+        n_samples = min(len(time_data), len(fault_data), self.waveform_samples)
+        slot = np.zeros(1, dtype=SLOT_HEADER_DTYPE)
+        slot["seq"] = seq
+        slot["n_samples"] = n_samples
+        data = np.zeros((2, self.waveform_samples), dtype="<f4")
+        data[0, :n_samples] = np.asarray(time_data[:n_samples])
+        data[1, :n_samples] = np.asarray(fault_data[:n_samples])
+
+        path = self._path(key, WAVEFORM_SUFFIX)
+        # r+b so the other slots are left alone, created on first use
+        with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+            file.seek((seq % self.waveform_slots) * self.slot_bytes)
+            file.write(slot.tobytes() + data.tobytes())
+
+    def _trim(self, path):
+        records = np.fromfile(path, dtype=RECORD_DTYPE)[-self.max_events :]
+        tmp_path = f"{path}.tmp"
+        records.tofile(tmp_path)
+        os.replace(tmp_path, path)
+
+    def events(self, cavity, last_n=None, since=None) -> np.ndarray:
+        """
+        :param last_n: only the most recent last_n events
+        :param since: only events validated at or after this unix time
+        :return: structured array with RECORD_DTYPE fields, oldest first
+        """
+        path = self._path(history_key(cavity), EVENT_SUFFIX)
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=RECORD_DTYPE)
+
+        if last_n is None:
+            records = np.fromfile(path, dtype=RECORD_DTYPE)
+        else:
+            # only read the tail of the file
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            skip = max(0, count - last_n)
+            records = np.fromfile(
+                path,
+                dtype=RECORD_DTYPE,
+                count=count - skip,
+                offset=skip * RECORD_DTYPE.itemsize,
+            )
+
+        if since is not None:
+            records = records[records["time"] >= since]
+        return records
+
+    def q_trend(self, cavity, last_n=None):
+        """
+        :return: (times, loaded Qs, saved loaded Qs) of the last last_n events
+        """
+        records = self.events(cavity, last_n)
+        return records["time"], records["loaded_q"], records["saved_loaded_q"]
+
+    def waveforms(self, cavity, seq):
+        """
+        :return: (time, fault) float32 arrays for event seq, or None if it was
+            not stored or has been overwritten
+        """
+        path = self._path(history_key(cavity), WAVEFORM_SUFFIX)
+        if not self.waveform_slots or not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as file:
+            file.seek((seq % self.waveform_slots) * self.slot_bytes)
+            buffer = file.read(self.slot_bytes)
+        if len(buffer) < self.slot_bytes:
+            return None
+
+        header = np.frombuffer(buffer, dtype=SLOT_HEADER_DTYPE, count=1)[0]
+        if header["seq"] != seq:
+            return None
+        data = np.frombuffer(
+            buffer, dtype="<f4", offset=SLOT_HEADER_DTYPE.itemsize
+        ).reshape(2, self.waveform_samples)
+        n_samples = int(header["n_samples"])
+        return data[0, :n_samples].copy(), data[1, :n_samples].copy()
+
+    def cavities(self) -> list:
+        return sorted(
+            os.path.basename(path)[: -len(EVENT_SUFFIX)]
+            for path in glob.glob(os.path.join(self.root, "*" + EVENT_SUFFIX))
+        )
+
+    def scan(self, last_n=None, since=None) -> dict:
+        """
+        Machine-wide read of every cavity's history.
+
+        :return: dict of file key (prefix with : replaced by _) -> records
+        """
+        return {key: self.events(key, last_n, since) for key in self.cavities()}
+
+    def degrading(self, last_n=20, min_events=3, max_ratio=0.9) -> list:
+        """
+        Cavities whose loaded Q is trending down, by the least squares slope
+        over their last last_n events extrapolated across that window.
+
+        :param max_ratio: flag cavities whose fitted loaded Q at the end of the
+            window is below this fraction of the fitted value at the start
+        :return: list of (key, ratio, number of events), lowest ratio first
+        """
+        flagged = []
+        for key, records in self.scan(last_n).items():
+            records = records[np.isfinite(records["loaded_q"])]
+            if len(records) < min_events:
+                continue
+            index = np.arange(len(records), dtype=float)
+            slope, intercept = np.polyfit(index, records["loaded_q"], 1)
+            start = intercept
+            end = intercept + slope * index[-1]
+            if start <= 0:
+                continue
+            ratio = end / start
+            if ratio < max_ratio:
+                flagged.append((key, float(ratio), len(records)))
+        return sorted(flagged, key=lambda item: item[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the quench history store")
+    parser.add_argument("root")
+    parser.add_argument("--trend", help="cavity PV prefix, e.g. ACCL:L1B:0210")
+    parser.add_argument("-n", "--last", type=int, default=20)
+    parser.add_argument("--degrading", action="store_true")
+    parser.add_argument("--max-ratio", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    history = QuenchHistory(args.root)
+
+    if args.trend:
+        times, loaded_qs, saved_loaded_qs = history.q_trend(args.trend, args.last)
+        for event_time, loaded_q, saved_loaded_q in zip(times, loaded_qs, saved_loaded_qs):
+            print(
+                f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event_time))} "
+                f"loaded Q {loaded_q:.3e} saved {saved_loaded_q:.3e}"
+            )
+
+    if args.degrading:
+        start = time.perf_counter()
+        flagged = history.degrading(args.last, max_ratio=args.max_ratio)
+        elapsed = time.perf_counter() - start
+        for key, ratio, n_events in flagged:
+            print(f"{key}: loaded Q trend {ratio:.2f}x over {n_events} events")
+        print(f"Scanned {len(history.cavities())} cavities in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+On-demand construction of the quench processing Machine.
+
+Building Machine(cavity_class=QuenchCavity, cryomodule_class=QuenchCryomodule)
+creates every cryomodule, rack, cavity and decarad in the linac just to reach
+one cavity. Here the cryomodule class handed to Machine only records its
+constructor arguments; the real QuenchCryomodule (and its cavities) is built
+the first time something on it is used.
+"""
+
+
+class LazyCryomodule:
+    """
+    Stand-in for a cryomodule that builds the real one on first attribute access.
+    """
+
+    def __init__(self, cryomodule_class, *args, **kwargs):
+        object.__setattr__(self, "_cryomodule_class", cryomodule_class)
+        object.__setattr__(self, "_args", args)
+        object.__setattr__(self, "_kwargs", kwargs)
+        object.__setattr__(self, "_cryomodule", None)
+
+    @classmethod
+    def factory(cls, cryomodule_class):
+        """
+        :return: callable to pass to Machine as cryomodule_class
+        """
+
+        def make(*args, **kwargs):
+            return cls(cryomodule_class, *args, **kwargs)
+
+        return make
+
+    @property
+    def is_built(self) -> bool:
+        return self._cryomodule is not None
+
+    def build(self):
+        if self._cryomodule is None:
+            object.__setattr__(
+                self, "_cryomodule", self._cryomodule_class(*self._args, **self._kwargs)
+            )
+        return self._cryomodule
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the stand-in itself
+        return getattr(self.build(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.build(), name, value)
+
+    def __str__(self):
+        return str(self.build())
+
+    def __repr__(self):
+        if self._cryomodule is None:
+            return f"<LazyCryomodule {self._cryomodule_class.__name__} (not built)>"
+        return repr(self._cryomodule)
+
+
+def quench_machine(cavity_class=None, cryomodule_class=None):
+    """
+    Machine whose cryomodules are only built when first used.
+
+    :param cavity_class: defaults to validation_test.QuenchCavity
+    :param cryomodule_class: defaults to QuenchCryomodule
+    """
+    # imported here so importing this module stays cheap
+    from utils.sc_linac.linac import Machine
+
+    if cavity_class is None:
+        from validation_test import QuenchCavity as cavity_class
+    if cryomodule_class is None:
+        from applications.quench_processing.quench_cryomodule import (
+            QuenchCryomodule as cryomodule_class,
+        )
+
+    return Machine(
+        cavity_class=cavity_class,
+        cryomodule_class=LazyCryomodule.factory(cryomodule_class),
+    )
+
+
+def quench_cavity(cryomodule_name, cavity_number, machine=None, **kwargs):
+    """
+    Get a single QuenchCavity, building only its cryomodule.
+
+    :param cryomodule_name: e.g. "03" or "H1"
+    :param cavity_number: 1-8
+    :param machine: machine from quench_machine to reuse, built if not given
+    :param kwargs: passed to quench_machine
+    """
+    machine = machine or quench_machine(**kwargs)
+    return machine.cryomodules[cryomodule_name].cavities[cavity_number]
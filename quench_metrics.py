@@ -0,0 +1,250 @@
+"""
+Latency instrumentation for quench processing.
+
+QuenchCavity records how long each phase takes (walking to quench, waiting,
+PV reads, decarad settling, fitting, time from the quench latch to the reset
+decision) into per-cavity histograms, and counts events such as detected,
+real and fake quenches. Everything lives in memory behind one lock, costs a
+perf_counter call per phase, and can be dumped to a JSON file or POSTed to an
+HTTP endpoint.
+
+Hooks registered with add_hook are called with (cavity, phase, seconds) after
+every observation, e.g. to log slow phases as they happen.
+
+Example:
+    metrics = shared_metrics()
+    metrics.add_hook(log_slow_phases(5.0))
+    ...
+    print(metrics.summary())
+    metrics.export("quench_metrics.json")
+"""
+
+import datetime
+import functools
+import json
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# histogram bucket upper edges (s), roughly 3 per decade from 1ms to ~1hr
+DEFAULT_BUCKETS = (
+    0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3600,
+)  # fmt: skip
+
+# key used for observations that are not tied to one cavity
+ALL_CAVITIES = "all"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # the last count is for everything above the last edge
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction) -> float:
+        """
+        Upper bucket edge below which fraction of the observations fall.
+        """
+        if not self.count:
+            return float("nan")
+        target = fraction * self.count
+        seen = 0
+        for edge, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(edge, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else None,
+            "min_s": self.min if self.count else None,
+            "max_s": self.max if self.count else None,
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+        }
+
+
+class QuenchMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.started = datetime.datetime.now()
+
+    def observe(self, cavity, phase, seconds):
+        """
+        :param cavity: cavity object (stored by its name) or None for ALL_CAVITIES
+        """
+        key = (_cavity_key(cavity), phase)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self.buckets)
+            self._histograms[key].observe(seconds)
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(key[0], phase, seconds)
+
+    @contextmanager
+    def time(self, cavity, phase):
+        """
+        Time the body of a with block, including when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(cavity, phase, time.perf_counter() - start)
+
+    def increment(self, cavity, name, amount=1):
+        key = (_cavity_key(cavity), name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counter(self, cavity, name) -> int:
+        return self._counters.get((_cavity_key(cavity), name), 0)
+
+    def histogram(self, cavity, phase):
+        return self._histograms.get((_cavity_key(cavity), phase))
+
+    def add_hook(self, hook):
+        """
+        :param hook: called as hook(cavity_name, phase, seconds) after every
+            observation, from the thread that made it, so keep it cheap
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started = datetime.datetime.now()
+
+    def snapshot(self) -> dict:
+        """
+        :return: {"cavities": {cavity: {"phases": {...}, "counters": {...}}}, ...}
+        """
+        with self._lock:
+            cavities = {}
+            for (cavity, phase), histogram in self._histograms.items():
+                entry = cavities.setdefault(cavity, {"phases": {}, "counters": {}})
+                entry["phases"][phase] = histogram.as_dict()
+            for (cavity, name), value in self._counters.items():
+                entry = cavities.setdefault(cavity, {"phases": {}, "counters": {}})
+                entry["counters"][name] = value
+
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "exported": datetime.datetime.now().isoformat(timespec="seconds"),
+            "cavities": cavities,
+        }
+
+    def export(self, destination, timeout=5.0):
+        """
+        Write the snapshot as JSON to a file, or POST it to an http(s) URL.
+        """
+        body = json.dumps(self.snapshot(), indent=2)
+        if destination.startswith(("http://", "https://")):
+            request = urllib.request.Request(
+                destination,
+                data=body.encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=timeout):
+                pass
+        else:
+            with open(destination, "w") as file:
+                file.write(body)
+        print(f"Metrics exported to: {destination}")
+
+    def summary(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for (cavity, phase), histogram in histograms:
+            lines.append(
+                f"{cavity} {phase}: n={histogram.count} "
+                f"mean={histogram.total / histogram.count:.3f}s "
+                f"p50<={histogram.quantile(0.5):.3f}s "
+                f"p95<={histogram.quantile(0.95):.3f}s "
+                f"max={histogram.max:.3f}s"
+            )
+        for (cavity, name), value in counters:
+            lines.append(f"{cavity} {name}: {value}")
+        return "\n".join(lines)
+
+
+def _cavity_key(cavity) -> str:
+    return ALL_CAVITIES if cavity is None else str(cavity)
+
+
+def timed_phase(phase):
+    """
+    Decorator timing a QuenchCavity method into self.metrics, if it has one.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = getattr(self, "metrics", None)
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            with metrics.time(self, phase):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def log_slow_phases(threshold, logger=None):
+    """
+    :return: hook that reports every phase that took longer than threshold (s)
+    """
+
+    def hook(cavity, phase, seconds):
+        if seconds > threshold:
+            message = f"{cavity} {phase} took {seconds:.2f}s"
+            if logger:
+                logger.warning(message)
+            else:
+                print(message)
+
+    return hook
+
+
+# one set of metrics shared by every cavity in the process
+_shared_metrics = None
+_shared_metrics_lock = threading.Lock()
+
+
+def shared_metrics() -> QuenchMetrics:
+    global _shared_metrics
+    with _shared_metrics_lock:
+        if _shared_metrics is None:
+            _shared_metrics = QuenchMetrics()
+        return _shared_metrics
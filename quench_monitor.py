@@ -0,0 +1,197 @@
+"""
+Event driven monitoring for quench processing.
+
+Instead of every cavity polling its quench latch once a second, QuenchMonitor
+subscribes to the PVs once and pushes updates to whichever code is waiting on
+that cavity. Channel access callbacks only drop the update on a queue; a single
+dispatcher thread shared by every cavity records the value and wakes the
+waiters, so callbacks never block the CA thread.
+
+The recorded values double as a snapshot cache: get() answers from memory
+while the value is younger than a staleness limit and only falls back to a
+blocking read when it is not (or the PV is disconnected). Values that only
+change on command get a longer limit than readbacks that update every scan.
+"""
+
+import queue
+import threading
+import time
+from collections import defaultdict
+
+# how often waiting code still wakes up on its own to run abort checks when
+# nothing is being pushed (s)
+ABORT_CHECK_INTERVAL = 1.0
+
+# how long to wait for the quench latch to read back cleared after a reset (s)
+LATCH_CLEAR_TIMEOUT = 1.0
+
+# how old a cached value may be before get() reads the PV again (s), for
+# readbacks the IOC updates continuously (amplitude, decarad dose) ...
+FAST_PV_MAX_AGE = 2.0
+# ... and for values that only change when someone sets them (RF state, mode,
+# ADES)
+SLOW_PV_MAX_AGE = 30.0
+
+
+class QuenchMonitor:
+    def __init__(self):
+        self._values = {}
+        self._timestamps = {}
+        self._received = {}
+        self._conditions = {}
+        self._groups = defaultdict(set)
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._updates = queue.Queue()
+        self._dispatcher = None
+
+        # how many get() calls were answered from memory vs by reading the PV
+        self.hits = 0
+        self.refreshes = 0
+
+    def subscribe(self, pv_obj, group):
+        """
+        Start pushing updates of pv_obj to anyone waiting on group.
+
+        :param pv_obj: PV (or FakePV) to monitor
+        :param group: key waiters use, normally the cavity
+        """
+        with self._lock:
+            self._groups[pv_obj.pvname].add(group)
+            if pv_obj.pvname in self._subscriptions:
+                return
+            self._subscriptions[pv_obj.pvname] = (
+                pv_obj,
+                pv_obj.add_callback(self._on_update),
+            )
+            self._start()
+
+        # seed with the current value so waiters do not need an update first
+        value = pv_obj.get()
+        if value is not None:
+            self._updates.put((pv_obj.pvname, value, pv_obj.timestamp))
+
+    def unsubscribe_all(self):
+        with self._lock:
+            for pv_obj, index in self._subscriptions.values():
+                pv_obj.remove_callback(index)
+            self._subscriptions.clear()
+            self._groups.clear()
+
+    def value(self, pvname, default=None):
+        return self._values.get(pvname, default)
+
+    def timestamp(self, pvname):
+        return self._timestamps.get(pvname)
+
+    def has_value(self, pvname) -> bool:
+        return pvname in self._values
+
+    def age(self, pvname) -> float:
+        """
+        Seconds since pvname was last updated or read, inf if never.
+        """
+        received = self._received.get(pvname)
+        return float("inf") if received is None else time.monotonic() - received
+
+    def get(self, pv_obj, max_age=FAST_PV_MAX_AGE):
+        """
+        Value of pv_obj from the snapshot if it is subscribed, connected and no
+        older than max_age, otherwise a blocking read that also refreshes the
+        snapshot.
+        """
+        pvname = pv_obj.pvname
+        if (
+            pvname in self._subscriptions
+            and getattr(pv_obj, "connected", True)
+            and self.age(pvname) <= max_age
+        ):
+            self.hits += 1
+            return self._values[pvname]
+
+        value = pv_obj.get()
+        self.refreshes += 1
+        if pvname in self._subscriptions and value is not None:
+            # through the queue so it cannot overwrite a newer pushed update
+            self._updates.put((pvname, value, pv_obj.timestamp))
+        return value
+
+    def wait_until(self, group, predicate, timeout, on_wake=None) -> bool:
+        """
+        Block until predicate() is true or timeout passes.
+
+        Wakes up whenever a PV of group updates, and at least every
+        ABORT_CHECK_INTERVAL seconds, to re-test the predicate and, if it is
+        still false, call on_wake (e.g. check_abort). The predicate always goes
+        first, so an update that satisfies it (a quench latching) is never
+        mistaken for an abort condition by on_wake.
+
+        :return: True if the predicate became true
+        """
+        deadline = time.monotonic() + timeout
+        condition = self._condition(group)
+
+        while True:
+            with condition:
+                if predicate():
+                    return True
+                if time.monotonic() >= deadline:
+                    return False
+
+            if on_wake:
+                on_wake()
+
+            # test again under the condition so an update that came in during
+            # on_wake cannot slip in between the test and the wait
+            with condition:
+                if predicate():
+                    return True
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+
+                condition.wait(min(remaining, ABORT_CHECK_INTERVAL))
+
+    def _condition(self, group) -> threading.Condition:
+        with self._lock:
+            if group not in self._conditions:
+                self._conditions[group] = threading.Condition()
+            return self._conditions[group]
+
+    def _on_update(self, pvname=None, value=None, timestamp=None, **kwargs):
+        # runs in the CA callback thread, so only hand the update off
+        self._updates.put((pvname, value, timestamp))
+
+    def _start(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(
+                target=self._dispatch, name="QuenchMonitor", daemon=True
+            )
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            pvname, value, timestamp = self._updates.get()
+            self._values[pvname] = value
+            self._timestamps[pvname] = timestamp
+            self._received[pvname] = time.monotonic()
+            with self._lock:
+                groups = list(self._groups.get(pvname, ()))
+            for group in groups:
+                condition = self._condition(group)
+                with condition:
+                    condition.notify_all()
+
+
+# one monitor shared by every cavity in the process
+_shared_monitor = None
+_shared_monitor_lock = threading.Lock()
+
+
+def shared_monitor() -> QuenchMonitor:
+    global _shared_monitor
+    with _shared_monitor_lock:
+        if _shared_monitor is None:
+            _shared_monitor = QuenchMonitor()
+        return _shared_monitor
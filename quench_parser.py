@@ -0,0 +1,290 @@
+import mmap
+import re  # importing regular expression module
+import warnings
+
+import numpy as np
+
+# a waveform section starts with the PV name followed by the waveform timestamp,
+# e.g. "ACCL:L3B:3180:CAV:FLTAWF 2022-06-30_16:49:05.440831 ..."
+SECTION_HEADER = re.compile(
+    r"(\S+:\S+)\s+(\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2}(?:\.\d+)?)"
+)
+
+# same pattern for scanning raw bytes out of a memory-mapped file
+SECTION_HEADER_BYTES = re.compile(SECTION_HEADER.pattern.encode())
+
+# signal name -> PV suffix of the waveforms a fault dump carries per cavity
+SIGNALS = {
+    "cavity": "CAV:FLTAWF",
+    "forward": "FWD:FLTAWF",
+    "reverse": "REV:FLTAWF",
+    "decay": "DECAYREFWF",
+    "time": "CAV:FLTTWF",
+}
+
+# matches integers, floats, scientific notation and nan/inf, only used when a
+# section has text mixed in with the samples
+NUMBER = re.compile(
+    r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)", re.IGNORECASE
+)
+
+
+def split_pv(pv):
+    """
+    ACCL:L3B:3180:CAV:FLTAWF -> ("ACCL:L3B:3180", "CAV:FLTAWF")
+    """
+    parts = pv.split(":")
+    return ":".join(parts[:3]), ":".join(parts[3:])
+
+
+def cavity_location(pv_prefix):
+    """
+    ACCL:L3B:3180 -> ("L3B", "31", 8), linac, cryomodule and cavity number
+    """
+    _, linac, location = pv_prefix.split(":")[:3]
+    return linac, location[:2], int(location[2])
+
+
+def decode_section(data_lines):
+    """
+    Turn the data lines of a section into one contiguous float64 array.
+
+    The fast path hands the whole section to numpy's C parser, which understands
+    exponents, nan and inf, so no Python float is made per sample. Sections with
+    text mixed in fall back to picking the numbers out with a regex.
+
+    :param data_lines: data part of each line, the PV and timestamp removed
+    :return: 1-D float64 ndarray of samples
+    """
+    text = " ".join(data_lines)
+    if "," in text:
+        text = text.replace(",", " ")
+
+    with warnings.catch_warnings():
+        # older numpy only warns when it cannot read to the end of the string
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.float64, sep=" ")
+        except (ValueError, DeprecationWarning):
+            pass
+
+    numbers = NUMBER.findall(text)
+    if not numbers:
+        print(f"Skipping section with no numeric data: {text[:80]}")
+    return np.array(numbers, dtype=np.float64)
+
+
+def _scan_sections(mm, complete_lines_only=False, stop=None):
+    """
+    Yield (pv, timestamp, data_parts, start, end) for every section in a
+    memory-mapped dump, starting from the current position of mm.
+
+    Only one line is held at a time, so memory stays flat no matter how big the
+    file is. data_parts is the list of byte strings after the PV and timestamp,
+    start/end are the byte offsets of the section (end exclusive).
+
+    :param complete_lines_only: stop at a last line with no newline yet, for
+        files that are still being written
+    :param stop: byte offset to stop scanning at, e.g. the end of one section
+        from index_sections
+    """
+    current_key = None
+    data_parts = []
+    section_start = line_start = mm.tell()
+
+    for line in iter(mm.readline, b""):
+        if stop is not None and line_start >= stop:
+            break
+        if complete_lines_only and not line.endswith(b"\n"):
+            break
+
+        match = SECTION_HEADER_BYTES.search(line)
+        if match:
+            key = (match.group(1), match.group(2))
+            if key != current_key:
+                if current_key is not None:
+                    pv, timestamp = current_key
+                    yield pv, timestamp, data_parts, section_start, line_start
+                current_key = key
+                data_parts = []
+                section_start = line_start
+            data_parts.append(line[match.end():].strip())
+        elif current_key is not None and current_key[0] in line:
+            data_parts.append(line.split(current_key[0], 1)[-1].strip())
+        elif current_key is not None:
+            yield current_key[0], current_key[1], data_parts, section_start, line_start
+            current_key = None
+            data_parts = []
+
+        line_start = mm.tell()
+
+    if current_key is not None:
+        yield current_key[0], current_key[1], data_parts, section_start, line_start
+
+
+def iter_sections(filename, keys=None):
+    """
+    Stream the waveform sections of a dump file without reading it into memory.
+
+    The file is memory mapped and walked line by line. Only the requested
+    sections are decoded, and the scan stops as soon as all of them were found.
+
+    :param filename: path to a QUENCH dump file
+    :param keys: iterable of (pv, timestamp) pairs to yield, or None for every section
+    :return: generator of (pv, timestamp, float64 ndarray)
+    """
+    wanted = None
+    if keys is not None:
+        wanted = {(pv.encode(), timestamp.encode()) for pv, timestamp in keys}
+        if not wanted:
+            return
+
+    with open(filename, "rb") as file:
+        try:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return
+
+        with mm:
+            for pv, timestamp, data_parts, _, _ in _scan_sections(mm):
+                if wanted is not None:
+                    if (pv, timestamp) not in wanted:
+                        continue
+                    wanted.discard((pv, timestamp))
+
+                data_lines = [part.decode("ascii", "replace") for part in data_parts]
+                yield pv.decode(), timestamp.decode(), decode_section(data_lines)
+
+                if wanted is not None and not wanted:
+                    # everything requested has been found, no need to read further
+                    return
+
+
+def read_waveforms(filename, keys, verbose=True):
+    """
+    Read a set of waveforms from a dump file in one streaming pass.
+
+    :param filename: path to a QUENCH dump file
+    :param keys: iterable of (pv, timestamp) pairs to extract
+    :param verbose: print each section found or missing
+    :return: dict mapping (pv, timestamp) -> float64 ndarray (empty if not found)
+    """
+    keys = list(keys)
+    waveforms = {}
+    for pv, timestamp, data in iter_sections(filename, keys):
+        if verbose:
+            print(f"Found section {pv} {timestamp} with {len(data)} points")
+        waveforms.setdefault((pv, timestamp), data)
+
+    for key in keys:
+        if key not in waveforms:
+            if verbose:
+                print(f"No section found for {key[0]} {key[1]}")
+            waveforms[key] = np.empty(0, dtype=np.float64)
+
+    return waveforms
+
+
+def list_sections(filename):
+    """
+    List every (pv, timestamp) section in a dump file without decoding any samples.
+
+    :param filename: path to a QUENCH dump file
+    :return: list of (pv, timestamp) in file order
+    """
+    with open(filename, "rb") as file:
+        try:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return []
+
+        with mm:
+            return [
+                (pv.decode(), timestamp.decode())
+                for pv, timestamp, _, _, _ in _scan_sections(mm)
+            ]
+
+
+def index_sections(filename):
+    """
+    Walk a dump once and record where every section lives, without decoding
+    any samples. Pass the index to read_sections to decode only the sections
+    that are needed, so a multi-GB dump is not scanned a second time.
+
+    :param filename: path to a QUENCH dump file
+    :return: dict mapping (pv, timestamp) -> (start, end) byte offsets, end
+        exclusive, in file order. A repeated section keeps its first offsets,
+        as read_waveforms does.
+    """
+    with open(filename, "rb") as file:
+        try:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return {}
+
+        with mm:
+            index = {}
+            for pv, timestamp, _, start, end in _scan_sections(mm):
+                index.setdefault((pv.decode(), timestamp.decode()), (start, end))
+            return index
+
+
+def read_sections(filename, index, keys):
+    """
+    Decode sections of a dump by seeking straight to them with an index.
+
+    :param filename: path to a QUENCH dump file
+    :param index: index of the same file from index_sections
+    :param keys: iterable of (pv, timestamp) pairs to decode
+    :return: dict mapping (pv, timestamp) -> float64 ndarray (empty if not in
+        the index)
+    """
+    waveforms = {key: np.empty(0, dtype=np.float64) for key in keys}
+    # in file order, so the pages are read front to back
+    found = sorted((index[key], key) for key in waveforms if key in index)
+    if not found:
+        return waveforms
+
+    with open(filename, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for (start, end), key in found:
+                mm.seek(start)
+                for _, _, data_parts, _, _ in _scan_sections(mm, stop=end):
+                    data_lines = [
+                        part.decode("ascii", "replace") for part in data_parts
+                    ]
+                    waveforms[key] = decode_section(data_lines)
+                    break
+
+    return waveforms
+
+
+def iter_sections_from(filename, offset=0, complete_lines_only=True):
+    """
+    Decode every complete section from a byte offset onwards, for following a
+    file that is still growing. A last line without a newline is left alone
+    unless complete_lines_only is False.
+
+    :param filename: path to a QUENCH dump file
+    :param offset: byte offset to start from (the start of a line)
+    :param complete_lines_only: False once the file has stopped growing, so a
+        last line that never got its newline is parsed too
+    :return: generator of (pv, timestamp, float64 ndarray, start, end)
+    """
+    with open(filename, "rb") as file:
+        try:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return
+
+        with mm:
+            if offset >= len(mm):
+                return
+            mm.seek(offset)
+            for pv, timestamp, data_parts, start, end in _scan_sections(
+                mm, complete_lines_only=complete_lines_only
+            ):
+                data_lines = [part.decode("ascii", "replace") for part in data_parts]
+                data = decode_section(data_lines)
+                yield pv.decode(), timestamp.decode(), data, start, end
@@ -0,0 +1,179 @@
+"""
+Fast plotting of quench waveforms.
+
+Long records are decimated to roughly screen resolution before they reach
+matplotlib (min/max buckets by default, or largest-triangle-three-buckets),
+dense series are drawn as line markers rather than scatter collections, and
+one figure is reused from event to event. headless=True renders with Agg and
+never opens a window.
+"""
+
+import numpy as np
+
+# about the horizontal resolution of a 14 inch figure at 100 dpi
+DEFAULT_MAX_POINTS = 2800
+
+# name -> (label, matplotlib style) for the signals in a QUENCH dump
+SIGNAL_STYLES = {
+    "cavity": ("Cavity", dict(color="blue")),
+    "forward": ("Forward Power", dict(color="green")),
+    "reverse": ("Reverse Power", dict(color="red")),
+    "decay": (
+        "Normal Cavity Decay Reference",
+        dict(color="cyan", linestyle="none", marker="o", markersize=1),
+    ),
+}
+
+
+def minmax_decimate(x, y, max_points=DEFAULT_MAX_POINTS):
+    """
+    Keep the minimum and maximum of each bucket so spikes and the quench edge
+    survive decimation.
+
+    :return: (x, y) with at most max_points (plus at most 2) samples
+    """
+    n = len(y)
+    n_buckets = max_points // 2
+    if n <= max_points or n_buckets < 1:
+        return x, y
+
+    bucket_size = n // n_buckets
+    full = n_buckets * bucket_size
+    buckets = y[:full].reshape(n_buckets, bucket_size)
+    starts = np.arange(n_buckets) * bucket_size
+
+    keep = np.sort(
+        np.stack(
+            [starts + np.argmin(buckets, axis=1), starts + np.argmax(buckets, axis=1)],
+            axis=1,
+        ),
+        axis=1,
+    ).ravel()
+
+    if full < n:
+        tail = y[full:]
+        keep = np.concatenate(
+            [keep, np.sort([full + np.argmin(tail), full + np.argmax(tail)])]
+        )
+
+    return x[keep], y[keep]
+
+
+def lttb_decimate(x, y, max_points=DEFAULT_MAX_POINTS):
+    """
+    Largest-triangle-three-buckets: pick the point in each bucket that forms
+    the largest triangle with the previously kept point and the average of the
+    next bucket. Looks closer to the original than min/max at the same count.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return x, y
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # first and last points are always kept, the rest is split into buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    keep = np.empty(max_points, dtype=np.intp)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area)) if end > start else start
+        keep[bucket + 1] = previous
+
+    return x[keep], y[keep]
+
+
+DECIMATORS = {
+    "minmax": minmax_decimate,
+    "lttb": lttb_decimate,
+}
+
+
+class QuenchPlotter:
+    """
+    Draws the cavity, forward, reverse and decay reference waveforms of an
+    event, reusing the same figure and line artists for every event.
+    """
+
+    def __init__(
+        self,
+        headless: bool = False,
+        max_points: int = DEFAULT_MAX_POINTS,
+        method: str = "minmax",
+        figsize=(14, 6),
+    ):
+        # matplotlib is only imported once something is actually plotted
+        import matplotlib
+
+        if headless:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        self.headless = headless
+        self.max_points = max_points
+        self.decimate = DECIMATORS[method]
+
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        self.ax.set_xlabel("Number of Data Points")
+        self.ax.set_ylabel("MV")
+        self.ax.grid(True)
+        self.lines = {}
+
+    def plot_event(self, waveforms, title, time_axis=None):
+        """
+        :param waveforms: dict of signal name (see SIGNAL_STYLES) -> samples
+        :param title: figure title
+        :param time_axis: x values, defaults to the sample index
+        """
+        min_length = min(len(data) for data in waveforms.values())
+        if time_axis is None:
+            time_axis = np.arange(min_length)
+        time_axis = np.asarray(time_axis)[:min_length]
+
+        for name, data in waveforms.items():
+            x, y = self.decimate(time_axis, np.asarray(data)[:min_length], self.max_points)
+            if name in self.lines:
+                self.lines[name].set_data(x, y)
+            else:
+                label, style = SIGNAL_STYLES.get(name, (name, {}))
+                (self.lines[name],) = self.ax.plot(x, y, label=label, **style)
+
+        # signals missing from this event should not linger from the last one
+        for name, line in self.lines.items():
+            line.set_visible(name in waveforms)
+
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        self.ax.set_title(title)
+        self.ax.legend(
+            [line for line in self.lines.values() if line.get_visible()],
+            [line.get_label() for line in self.lines.values() if line.get_visible()],
+        )
+        self.fig.tight_layout()
+
+    def save(self, plot_filename):
+        self.fig.savefig(plot_filename)
+        print(f"Plot saved as: {plot_filename}")
+
+    def show(self):
+        # never blocks in headless mode
+        if not self.headless:
+            self.plt.show()
+
+    def close(self):
+        self.plt.close(self.fig)
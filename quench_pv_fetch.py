@@ -0,0 +1,181 @@
+"""
+Concurrent acquisition of fault waveforms for many QuenchCavity objects.
+
+Every PV read is issued from a thread pool so the channel access round trips
+overlap instead of running one after another. Waiting for the fault waveforms
+to update is done with PV callbacks rather than a fixed sleep.
+
+FakePV/FakePVBackend give an in-process stand-in for channel access so all of
+this can be exercised without an IOC.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# how long to wait for fault waveforms to refresh after a quench (s)
+WAVEFORM_UPDATE_TIMEOUT = 1.0
+
+MAX_FETCH_THREADS = 32
+
+
+class FakePV:
+    """
+    In-process stand-in for an epics PV with the parts of the interface the
+    quench code uses: get, put, timestamp, severity and callbacks.
+    """
+
+    def __init__(self, pvname, value=None, severity=0):
+        self.pvname = pvname
+        self.connected = True
+        self.severity = severity
+        self.timestamp = time.time() if value is not None else None
+        self._value = value
+        self._callbacks = {}
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<FakePV {self.pvname}: {self._value!r}>"
+
+    def get(self, *args, **kwargs):
+        return self._value
+
+    def put(self, value, *args, **kwargs):
+        with self._lock:
+            self._value = value
+            self.timestamp = time.time()
+            callbacks = list(self._callbacks.values())
+        for callback in callbacks:
+            callback(
+                pvname=self.pvname,
+                value=value,
+                timestamp=self.timestamp,
+                severity=self.severity,
+            )
+        return 1
+
+    def add_callback(self, callback, *args, **kwargs):
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+            self._callbacks[index] = callback
+        return index
+
+    def remove_callback(self, index):
+        with self._lock:
+            self._callbacks.pop(index, None)
+
+    def clear_callbacks(self):
+        with self._lock:
+            self._callbacks.clear()
+
+
+class FakePVBackend:
+    """
+    Registry of FakePVs shared by name, so every object asking for the same PV
+    sees the same value.
+    """
+
+    def __init__(self):
+        self._pvs = {}
+        self._lock = threading.Lock()
+
+    def pv(self, pvname) -> FakePV:
+        with self._lock:
+            if pvname not in self._pvs:
+                self._pvs[pvname] = FakePV(pvname)
+            return self._pvs[pvname]
+
+    def set(self, pvname, value):
+        self.pv(pvname).put(value)
+
+    def get(self, pvname):
+        return self.pv(pvname).get()
+
+    def attach(self, cavity):
+        """
+        Point the lazily created PV objects of a QuenchCavity at this backend.
+        """
+        cavity._fault_waveform_pv_obj = self.pv(cavity.fault_waveform_pv)
+        cavity._fault_time_waveform_pv_obj = self.pv(cavity.fault_time_waveform_pv)
+        cavity._current_q_loaded_pv_obj = self.pv(cavity.current_q_loaded_pv)
+        cavity._quench_latch_pv_obj = self.pv(cavity.quench_latch_pv)
+        cavity._decay_ref_pv_obj = self.pv(cavity.decay_ref_pv)
+
+
+def wait_for_update(pv_obj, since, timeout=WAVEFORM_UPDATE_TIMEOUT) -> bool:
+    """
+    Block until pv_obj has a timestamp newer than since, or until timeout.
+
+    :param pv_obj: PV (or FakePV) to watch
+    :param since: epoch seconds the value has to be newer than, None to skip
+    :return: True if the PV updated in time
+    """
+    if since is None or (pv_obj.timestamp or 0) > since:
+        return True
+
+    updated = threading.Event()
+
+    def callback(timestamp=None, **kwargs):
+        if (timestamp or 0) > since:
+            updated.set()
+
+    index = pv_obj.add_callback(callback)
+    try:
+        # the value may have changed between the first check and the subscription
+        if (pv_obj.timestamp or 0) > since:
+            return True
+        return updated.wait(timeout)
+    finally:
+        pv_obj.remove_callback(index)
+
+
+def _fetch_cavity(cavity, wait, timeout):
+    if wait:
+        # fault waveforms are written after the quench latches, so wait for
+        # them to be newer than the latch
+        since = cavity.quench_latch_pv_obj.timestamp
+        for pv_obj in (cavity.fault_time_waveform_pv_obj, cavity.fault_waveform_pv_obj):
+            if not wait_for_update(pv_obj, since, timeout):
+                print(f"{cavity} {pv_obj.pvname} did not update within {timeout}s")
+
+    return (
+        cavity.fault_time_waveform_pv_obj.get(),
+        cavity.fault_waveform_pv_obj.get(),
+        cavity.current_q_loaded_pv_obj.get(),
+        cavity.decay_ref_pv_obj.get(),
+    )
+
+
+def fetch_fault_data(
+    cavities,
+    wait_for_update: bool = False,
+    timeout: float = WAVEFORM_UPDATE_TIMEOUT,
+    max_workers: int = MAX_FETCH_THREADS,
+) -> list:
+    """
+    Read the fault time waveform, fault waveform, saved loaded Q and decay
+    reference (DECAYREFWF) of every cavity concurrently.
+
+    :param cavities: QuenchCavity objects
+    :param wait_for_update: wait for each cavity's fault waveforms to refresh
+        after its quench latch before reading them
+    :param timeout: longest to wait for a waveform update per cavity (s)
+    :return: list of (time_data, fault_data, saved_loaded_q, decay_ref), one
+        per cavity
+    """
+    cavities = list(cavities)
+    if not cavities:
+        return []
+    if len(cavities) == 1:
+        # nothing to overlap, and a pool per call would sit on the reset path
+        return [_fetch_cavity(cavities[0], wait_for_update, timeout)]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cavities))) as executor:
+        return list(
+            executor.map(
+                lambda cavity: _fetch_cavity(cavity, wait_for_update, timeout),
+                cavities,
+            )
+        )
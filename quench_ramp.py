@@ -0,0 +1,126 @@
+"""
+Adaptive amplitude steps for walk_to_quench.
+
+The fixed schedule (0.2 MV every 30 s) is sized for the last MV or so below
+where a cavity quenches, but is also used from the start amplitude up, where
+nothing happens. AdaptiveRamp picks every step from where the cavity is:
+
+- amplitude: within approach_margin of the amplitude it last quenched at
+  (pre_quench_amp), always the conservative step. With no quench amplitude
+  known, the ceiling is unknown_quench_fraction of ades_max instead, and
+  without ades_max either every step is conservative.
+- radiation: above quiet_dose_fraction of the radiation limit, conservative.
+- field emission: if the dose rose faster than fe_rise_limit (fraction of the
+  limit per MV) over the previous step, field emission is turning on, so
+  conservative.
+
+Otherwise it takes up to max_step_size, never stepping past the ceiling, with
+a shorter hold of fast_step_time. Once less than step_size is left below the
+ceiling it is conservative again.
+
+Example:
+    ramp = AdaptiveRamp(radiation_limit=RADIATION_LIMIT, ades_max=cavity.ades_max)
+    step_size, step_time = ramp.next_step(ades, end_amp, dose, pre_quench_amp)
+"""
+
+# conservative schedule, same as walk_to_quench's defaults
+STEP_SIZE = 0.2
+STEP_TIME = 30
+
+# fast schedule far from the quench amplitude
+MAX_STEP_SIZE = 1.0
+FAST_STEP_TIME = 10
+
+# how far below the last quench amplitude to switch to conservative steps (MV)
+APPROACH_MARGIN = 1.0
+
+# fraction of ades_max fast steps stop at while the quench amplitude is unknown
+UNKNOWN_QUENCH_FRACTION = 0.6
+
+# dose, as a fraction of the radiation limit, below which radiation is quiet
+QUIET_DOSE_FRACTION = 0.25
+
+# dose rise, as a fraction of the radiation limit per MV, taken to mean field
+# emission is starting
+FE_RISE_LIMIT = 0.05
+
+
+class AdaptiveRamp:
+    def __init__(
+        self,
+        step_size=STEP_SIZE,
+        step_time=STEP_TIME,
+        max_step_size=MAX_STEP_SIZE,
+        fast_step_time=FAST_STEP_TIME,
+        approach_margin=APPROACH_MARGIN,
+        radiation_limit=None,
+        ades_max=None,
+        unknown_quench_fraction=UNKNOWN_QUENCH_FRACTION,
+        quiet_dose_fraction=QUIET_DOSE_FRACTION,
+        fe_rise_limit=FE_RISE_LIMIT,
+    ):
+        """
+        :param step_size: conservative step (MV)
+        :param step_time: conservative hold (s)
+        :param radiation_limit: defaults to quench_utils.RADIATION_LIMIT
+        :param ades_max: cavity's AMAX (MV), for the ceiling before the cavity
+            has quenched
+        """
+        if radiation_limit is None:
+            # imported here so simulations do not need the linac packages
+            from applications.quench_processing.quench_utils import RADIATION_LIMIT
+
+            radiation_limit = RADIATION_LIMIT
+
+        self.step_size = step_size
+        self.step_time = step_time
+        self.max_step_size = max(max_step_size, step_size)
+        self.fast_step_time = min(fast_step_time, step_time)
+        self.approach_margin = approach_margin
+        self.radiation_limit = radiation_limit
+        self.ades_max = ades_max
+        self.unknown_quench_fraction = unknown_quench_fraction
+        self.quiet_dose_fraction = quiet_dose_fraction
+        self.fe_rise_limit = fe_rise_limit
+
+        self._last_amp = None
+        self._last_dose = None
+        # reason for the last decision, for logging
+        self.reason = None
+
+    def conservative(self, reason):
+        self.reason = reason
+        return self.step_size, self.step_time
+
+    def next_step(self, ades, end_amp, dose, pre_quench_amp=None):
+        """
+        :param ades: current amplitude (MV)
+        :param end_amp: amplitude the walk stops at (MV)
+        :param dose: current max decarad dose
+        :param pre_quench_amp: amplitude the cavity last quenched at, if known
+        :return: (step size in MV, hold time in s)
+        """
+        fe_rise = None
+        if self._last_amp is not None and ades > self._last_amp:
+            fe_rise = (dose - self._last_dose) / (ades - self._last_amp)
+        self._last_amp = ades
+        self._last_dose = dose
+
+        # the approach zone is the margin below the last quench amplitude
+        if pre_quench_amp:
+            ceiling = min(end_amp, pre_quench_amp - self.approach_margin)
+        elif self.ades_max:
+            ceiling = min(end_amp, self.unknown_quench_fraction * self.ades_max)
+        else:
+            return self.conservative("quench amplitude unknown")
+        if ceiling - ades < self.step_size:
+            return self.conservative("near quench ceiling")
+
+        if dose > self.quiet_dose_fraction * self.radiation_limit:
+            return self.conservative("radiation above quiet level")
+        if fe_rise is not None and fe_rise > self.fe_rise_limit * self.radiation_limit:
+            return self.conservative("field emission rising")
+
+        self.reason = "fast"
+        step_size = min(self.max_step_size, ceiling - ades)
+        return step_size, self.fast_step_time
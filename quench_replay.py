@@ -0,0 +1,239 @@
+"""
+Offline replay of quench validation against recorded fault waveforms.
+
+Runs the same loaded Q fit and real/fake verdict as
+QuenchCavity.validate_quench, but on waveforms from QUENCH dump files instead
+of live PVs, so whole archives can be re-scored (e.g. after retuning
+LOADED_Q_CHANGE_FOR_QUENCH) without a Machine.
+
+Saved loaded Q values come from a <prefix>:QLOADED section in the dump when
+there is one, otherwise from a JSON table of
+{"pv_prefix": ..., "timestamp": ... (optional), "saved_loaded_q": ...}
+records (quench_synth --truth writes this format).
+
+When the dump has the cavity's DECAYREFWF, every event is also scored against
+it with quench_decay as a second, independent verdict (decay_is_real).
+
+Example:
+    python quench_replay.py /data/faults/ --saved-q saved_q.json --threshold 0.5 -w 16
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from quench_batch import find_files
+from quench_decay import is_real_by_decay, score_decays
+from quench_fit import (
+    LOADED_Q_CHANGE_FOR_QUENCH,
+    cavity_frequency,
+    fit_loaded_q_batch,
+    is_real_quench,
+)
+from quench_parser import SIGNALS, cavity_location, index_sections, read_sections
+
+FAULT_SUFFIX = ":" + SIGNALS["cavity"]
+TIME_SUFFIX = ":" + SIGNALS["time"]
+SAVED_Q_SUFFIX = ":QLOADED"
+DECAY_REF_SUFFIX = ":" + SIGNALS["decay"]
+
+
+def load_saved_q(path):
+    """
+    :return: dict keyed by (pv_prefix, timestamp) and by pv_prefix -> saved loaded Q
+    """
+    saved_q = {}
+    if not path:
+        return saved_q
+    with open(path) as file:
+        for record in json.load(file):
+            if record.get("timestamp"):
+                key = (record["pv_prefix"], record["timestamp"])
+            else:
+                key = record["pv_prefix"]
+            saved_q[key] = float(record["saved_loaded_q"])
+    return saved_q
+
+
+def replay_file(filename, saved_q=None, threshold=LOADED_Q_CHANGE_FOR_QUENCH):
+    """
+    Validate every cavity fault recorded in one dump.
+
+    :param saved_q: table from load_saved_q, used when the dump has no QLOADED
+    :param threshold: fraction of the saved loaded Q below which a quench is real
+    :return: list of per-event verdict dicts
+    """
+    saved_q = saved_q or {}
+    # one pass to find the sections, then read_sections seeks to just those
+    index = index_sections(filename)
+    events = [
+        (pv[: -len(FAULT_SUFFIX)], timestamp)
+        for pv, timestamp in index
+        if pv.endswith(FAULT_SUFFIX)
+    ]
+    if not events:
+        return []
+
+    keys = []
+    for pv_prefix, timestamp in events:
+        keys += [
+            (pv_prefix + FAULT_SUFFIX, timestamp),
+            (pv_prefix + TIME_SUFFIX, timestamp),
+            (pv_prefix + SAVED_Q_SUFFIX, timestamp),
+            (pv_prefix + DECAY_REF_SUFFIX, timestamp),
+        ]
+    waveforms = read_sections(filename, index, keys)
+
+    saved_loaded_qs = np.full(len(events), np.nan)
+    for idx, (pv_prefix, timestamp) in enumerate(events):
+        recorded = waveforms[(pv_prefix + SAVED_Q_SUFFIX, timestamp)]
+        if recorded.size:
+            saved_loaded_qs[idx] = recorded[0]
+        else:
+            saved_loaded_qs[idx] = saved_q.get(
+                (pv_prefix, timestamp), saved_q.get(pv_prefix, np.nan)
+            )
+
+    frequencies = [
+        cavity_frequency(cavity_location(pv_prefix)[1]) for pv_prefix, _ in events
+    ]
+    loaded_qs, pre_quench_amps = fit_loaded_q_batch(
+        [waveforms[(pv_prefix + TIME_SUFFIX, ts)] for pv_prefix, ts in events],
+        [waveforms[(pv_prefix + FAULT_SUFFIX, ts)] for pv_prefix, ts in events],
+        frequencies,
+    )
+    is_real = is_real_quench(loaded_qs, saved_loaded_qs, threshold)
+
+    references = [
+        waveforms[(pv_prefix + DECAY_REF_SUFFIX, ts)] for pv_prefix, ts in events
+    ]
+    scores = score_decays(
+        [waveforms[(pv_prefix + TIME_SUFFIX, ts)] for pv_prefix, ts in events],
+        [waveforms[(pv_prefix + FAULT_SUFFIX, ts)] for pv_prefix, ts in events],
+        references,
+    )
+    decay_is_real = is_real_by_decay(scores["rate_ratio"], threshold)
+
+    results = []
+    for idx, (pv_prefix, timestamp) in enumerate(events):
+        has_saved_q = not np.isnan(saved_loaded_qs[idx])
+        saved_loaded_q = float(saved_loaded_qs[idx]) if has_saved_q else None
+        results.append(
+            {
+                "file": os.path.abspath(filename),
+                "pv_prefix": pv_prefix,
+                "timestamp": timestamp,
+                "loaded_q": float(loaded_qs[idx]),
+                "saved_loaded_q": saved_loaded_q,
+                "threshold": threshold * saved_loaded_q if has_saved_q else None,
+                "pre_quench_amp": float(pre_quench_amps[idx]),
+                # no verdict without something to compare against
+                "is_real": bool(is_real[idx]) if has_saved_q else None,
+                "decay_rate_ratio": _optional(scores["rate_ratio"][idx]),
+                "decay_residual": _optional(scores["residual"][idx]),
+                "decay_correlation": _optional(scores["correlation"][idx]),
+                "decay_is_real": (
+                    bool(decay_is_real[idx]) if references[idx].size else None
+                ),
+            }
+        )
+    return results
+
+
+def _optional(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _replay_file(args):
+    filename, saved_q, threshold = args
+    try:
+        return filename, replay_file(filename, saved_q, threshold), None
+    except Exception as e:
+        return filename, [], f"{type(e).__name__}: {e}"
+
+
+def replay(
+    paths,
+    saved_q=None,
+    threshold=LOADED_Q_CHANGE_FOR_QUENCH,
+    workers=None,
+    pattern="*_QUENCH.txt",
+):
+    """
+    Replay every dump under paths over a process pool.
+
+    :return: (list of per-event verdicts, dict of filename -> error)
+    """
+    files = find_files(paths, pattern)
+    print(f"Replaying {len(files)} files with {workers or os.cpu_count()} workers")
+
+    verdicts = []
+    errors = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # chunks keep the per-task overhead down on archives of small files
+        chunksize = max(1, len(files) // (4 * (workers or os.cpu_count() or 1)))
+        for filename, results, error in executor.map(
+            _replay_file,
+            [(filename, saved_q, threshold) for filename in files],
+            chunksize=chunksize,
+        ):
+            verdicts += results
+            if error:
+                errors[filename] = error
+                print(f"error: {os.path.basename(filename)}: {error}")
+
+    return verdicts, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score recorded quenches offline")
+    parser.add_argument("paths", nargs="+", help="directories, files or glob patterns")
+    parser.add_argument("--saved-q", help="JSON table of saved loaded Q values")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=LOADED_Q_CHANGE_FOR_QUENCH,
+        help="fraction of the saved loaded Q below which a quench is real",
+    )
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--pattern", default="*_QUENCH.txt")
+    parser.add_argument("-o", "--output", default="quench_replay.json")
+    args = parser.parse_args(argv)
+
+    verdicts, errors = replay(
+        args.paths,
+        saved_q=load_saved_q(args.saved_q),
+        threshold=args.threshold,
+        workers=args.workers,
+        pattern=args.pattern,
+    )
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {"threshold": args.threshold, "verdicts": verdicts, "errors": errors},
+            file,
+            indent=2,
+        )
+
+    real = sum(verdict["is_real"] is True for verdict in verdicts)
+    fake = sum(verdict["is_real"] is False for verdict in verdicts)
+    print(
+        f"{len(verdicts)} events: {real} real, {fake} fake, "
+        f"{len(verdicts) - real - fake} without saved Q, {len(errors)} files failed"
+    )
+    both = [
+        verdict
+        for verdict in verdicts
+        if verdict["is_real"] is not None and verdict["decay_is_real"] is not None
+    ]
+    if both:
+        agree = sum(verdict["is_real"] == verdict["decay_is_real"] for verdict in both)
+        print(f"Decay reference verdict agrees on {agree}/{len(both)} events")
+    print(f"Report saved as: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
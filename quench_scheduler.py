@@ -0,0 +1,266 @@
+"""
+Run quench processing on several cavities of a cryomodule at once.
+
+Cavities spend most of quench_process holding at an amplitude waiting for
+decarads or for a quench, so running them side by side cuts the campaign time
+roughly by the number of cavities. What has to stay serial is handled here:
+
+- radiation: every cavity reports into the same decarads, so the combined dose
+  is checked against RADIATION_LIMIT on every abort check (from the cavity's
+  monitor snapshot when it has one, see QuenchCavity.max_raw_dose), and a
+  cavity may only raise its amplitude while the dose is below STEP_DOSE_MARGIN
+  of the limit. Amplitude steps are also spaced out so two cavities never step at the
+  same moment and stack their radiation before the decarads catch up.
+- settling: while a cavity is waiting for the decarads to settle after a
+  quench, its neighbours hold their amplitude instead of stepping.
+- aborts: one failing cavity (radiation, uncaught quench, operator abort)
+  aborts all of them. The abort flag of every running cavity is raised so
+  each one stops at its next check_abort, and is turned off once its
+  quench_process has returned. Cavities not started yet are never started, and
+  no cavity is left with its abort flag up once the campaign is over.
+
+QuenchCavity calls into the scheduler it is given (wait_for_step before each
+step, settling around decarad settling, check_abort from its own check_abort),
+so the same scheduler drives real cavities and quench_sim.SimCavity.
+
+Example:
+    scheduler = QuenchScheduler(list(cryomodule.cavities.values()), max_concurrent=4)
+    results = scheduler.run(start_amp=5, end_amp=21)
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# fraction of the radiation limit the combined dose must be below to step
+STEP_DOSE_MARGIN = 0.8
+
+# minimum time between amplitude steps of any two cavities (s)
+STEP_SPACING = 2.0
+
+# how often blocked cavities re-check the dose and run abort checks (s)
+SCHEDULER_POLL_INTERVAL = 1.0
+
+# a cavity held this long without being allowed to step means the radiation
+# budget is used up at the current amplitudes (s)
+STEP_WAIT_TIMEOUT = 600
+
+
+class QuenchAbortError(Exception):
+    """
+    Raised in every scheduled cavity once any of them aborts the campaign.
+    """
+
+
+def _read_dose(cavity) -> float:
+    dose = getattr(cavity, "max_raw_dose", None)
+    if dose is None:
+        dose = cavity.decarad.max_raw_dose
+    return dose
+
+
+class QuenchScheduler:
+    def __init__(
+        self,
+        cavities,
+        max_concurrent=None,
+        radiation_limit=None,
+        step_margin=STEP_DOSE_MARGIN,
+        step_spacing=STEP_SPACING,
+        neighbor_distance=None,
+        poll_interval=SCHEDULER_POLL_INTERVAL,
+        step_timeout=STEP_WAIT_TIMEOUT,
+    ):
+        """
+        :param cavities: QuenchCavity (or SimCavity) objects
+        :param max_concurrent: cavities processed at once, all of them by default
+        :param radiation_limit: defaults to quench_utils.RADIATION_LIMIT
+        :param neighbor_distance: cavities this far apart in number hold for
+            each other's settling, None for every cavity sharing a decarad
+        """
+        if radiation_limit is None:
+            # imported here so simulations do not need the linac packages
+            from applications.quench_processing.quench_utils import RADIATION_LIMIT
+
+            radiation_limit = RADIATION_LIMIT
+
+        self.cavities = list(cavities)
+        self.max_concurrent = max_concurrent or len(self.cavities)
+        self.radiation_limit = radiation_limit
+        self.step_margin = step_margin
+        self.step_spacing = step_spacing
+        self.neighbor_distance = neighbor_distance
+        self.poll_interval = poll_interval
+        self.step_timeout = step_timeout
+
+        # one entry per physical decarad, however many cavities point at it,
+        # with the first cavity reporting into it to read the dose through
+        self._dose_readers = {}
+        for cavity in self.cavities:
+            self._dose_readers.setdefault(id(cavity.decarad), cavity)
+        self.decarads = [cavity.decarad for cavity in self._dose_readers.values()]
+
+        self._condition = threading.Condition()
+        self._settling = set()
+        self._running = set()
+        self._last_step = float("-inf")
+        self._abort_event = threading.Event()
+        self.abort_reason = None
+
+    @property
+    def aborted(self) -> bool:
+        return self._abort_event.is_set()
+
+    @property
+    def dose(self) -> float:
+        """
+        Highest raw dose across every decarad the cavities report into.
+
+        Read through a cavity's max_raw_dose, which comes from its monitor
+        snapshot when it has one, so wakes do not each read every head. Falls
+        back to the decarad for cavities without it (quench_sim.SimCavity).
+        """
+        return max(
+            (_read_dose(cavity) for cavity in self._dose_readers.values()), default=0
+        )
+
+    def neighbors(self, cavity) -> list:
+        if self.neighbor_distance is None:
+            return [
+                other
+                for other in self.cavities
+                if other is not cavity and other.decarad is cavity.decarad
+            ]
+        return [
+            other
+            for other in self.cavities
+            if other is not cavity
+            and abs(other.number - cavity.number) <= self.neighbor_distance
+        ]
+
+    def abort(self, reason):
+        """
+        Stop every running cavity at its next abort check.
+        """
+        with self._condition:
+            if self._abort_event.is_set():
+                return
+            self.abort_reason = reason
+            self._abort_event.set()
+            self._condition.notify_all()
+
+            # cavities that have not started or have finished are left alone,
+            # a raised flag would abort whatever is run on them next
+            print(f"Aborting quench processing for all cavities: {reason}")
+            for cavity in self._running:
+                cavity.abort_flag = True
+
+    def check_abort(self, cavity, dose=None):
+        """
+        Shared part of every cavity's check_abort.
+
+        :param dose: dose already read by the caller, read here if None
+        """
+        if self.aborted:
+            raise QuenchAbortError(f"{cavity} stopped: {self.abort_reason}")
+
+        if dose is None:
+            dose = self.dose
+        if dose > self.radiation_limit:
+            self.abort(f"Combined radiation dose {dose} over limit {self.radiation_limit}")
+            raise QuenchAbortError(f"{cavity} stopped: {self.abort_reason}")
+
+    def _may_step(self, cavity, dose) -> bool:
+        if self._settling.intersection(self.neighbors(cavity)):
+            return False
+        if time.monotonic() - self._last_step < self.step_spacing:
+            return False
+        return dose < self.step_margin * self.radiation_limit
+
+    def wait_for_step(self, cavity):
+        """
+        Block until cavity may raise its amplitude, then claim the step.
+        """
+        deadline = time.monotonic() + self.step_timeout
+        while True:
+            # read outside the condition, a read that falls through to the IOC
+            # must not hold up the other cavities' settling and steps
+            dose = self.dose
+            self.check_abort(cavity, dose)
+            with self._condition:
+                if self._may_step(cavity, dose):
+                    self._last_step = time.monotonic()
+                    return
+                if time.monotonic() > deadline:
+                    self.abort(
+                        f"{cavity} held {self.step_timeout}s, radiation budget used up"
+                    )
+                    self.check_abort(cavity, dose)
+                self._condition.wait(self.poll_interval)
+
+    @contextmanager
+    def settling(self, cavity):
+        """
+        Mark cavity as waiting for decarads to settle after a quench.
+        """
+        with self._condition:
+            self._settling.add(cavity)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._settling.discard(cavity)
+                self._condition.notify_all()
+
+    def _process(self, cavity, kwargs):
+        with self._condition:
+            if self.aborted:
+                return cavity, QuenchAbortError(
+                    f"{cavity} not started: {self.abort_reason}"
+                )
+            self._running.add(cavity)
+
+        cavity.scheduler = self
+        try:
+            cavity.quench_process(**kwargs)
+            return cavity, None
+        except Exception as e:
+            # the first failure takes everyone down, later ones are its echo
+            self.abort(f"{cavity}: {type(e).__name__}: {e}")
+            # not every path out of quench_process turns the RF off
+            try:
+                cavity.turn_off()
+            except Exception as turn_off_error:
+                print(f"Could not turn off {cavity}: {turn_off_error}")
+            return cavity, e
+        finally:
+            cavity.scheduler = None
+            with self._condition:
+                self._running.discard(cavity)
+                # an abort that came in after the cavity's last check
+                cavity.abort_flag = False
+
+    def run(self, **quench_process_kwargs) -> dict:
+        """
+        Run quench_process on every cavity, max_concurrent at a time.
+
+        :return: dict of cavity -> None if it finished, else the exception
+        """
+        start = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent, thread_name_prefix="QuenchScheduler"
+        ) as executor:
+            results = dict(
+                executor.map(
+                    lambda cavity: self._process(cavity, quench_process_kwargs),
+                    self.cavities,
+                )
+            )
+
+        done = sum(error is None for error in results.values())
+        print(
+            f"Quench processed {done}/{len(self.cavities)} cavities "
+            f"in {time.monotonic() - start:.1f}s"
+        )
+        return results
@@ -0,0 +1,278 @@
+"""
+Simulated cavities and decarads for exercising quench processing schedules
+without RF.
+
+SimCavity runs a compressed version of QuenchCavity.quench_process (step up,
+hold, quench, settle, retry) against a quench amplitude that rises every time
+it quenches, the way conditioning does. SimDecarad reads the summed field
+emission and post-quench radiation of every cavity attached to it, so a
+QuenchScheduler sees the same coupling it has to manage on a real cryomodule.
+Passing a quench_ramp.AdaptiveRamp to quench_process swaps the fixed steps for
+adaptive ones, so ramp schedules can be compared offline too.
+Times are in seconds but scaled down about 300x from the real ones (a 0.1s
+step hold stands for 30s).
+
+Example:
+    python quench_sim.py --cavities 8 --concurrent 8
+    python quench_sim.py --compare-ramps
+"""
+
+import argparse
+import math
+import threading
+import time
+
+import numpy as np
+
+from quench_ramp import AdaptiveRamp
+from quench_scheduler import QuenchAbortError, QuenchScheduler
+
+# dose units are arbitrary, the limit just has to match
+SIM_RADIATION_LIMIT = 1.0
+
+# field emission dose per cavity is FE_COEFFICIENT * (amp - FE_ONSET)^2
+FE_ONSET = 12.0
+FE_COEFFICIENT = 0.001
+
+# extra dose right after a quench, decaying with QUENCH_DOSE_DECAY (s)
+QUENCH_DOSE = 0.3
+QUENCH_DOSE_DECAY = 0.01
+
+# AMAX of every simulated cavity (MV)
+SIM_ADES_MAX = 21.0
+
+# how much a quench raises the amplitude the cavity next quenches at (MV)
+CONDITIONING_GAIN = 0.4
+
+
+class SimDecarad:
+    def __init__(self, background=0.0):
+        self.background = background
+        self.cavities = []
+        self.peak_dose = 0.0
+
+    @property
+    def max_raw_dose(self) -> float:
+        dose = self.background + sum(cavity.dose for cavity in self.cavities)
+        self.peak_dose = max(self.peak_dose, dose)
+        return dose
+
+
+class SimCavity:
+    def __init__(self, number, decarad, quench_amp, radiation_limit=SIM_RADIATION_LIMIT):
+        self.number = number
+        self.decarad = decarad
+        decarad.cavities.append(self)
+        self.quench_amp = quench_amp
+        self.radiation_limit = radiation_limit
+        self.ades_max = SIM_ADES_MAX
+
+        self.ades = 0.0
+        self.is_on = False
+        self.is_quenched = False
+        self.quench_count = 0
+        self.pre_quench_amp = None
+        self.abort_flag = False
+        self.scheduler = None
+        self._quench_time = None
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"SimCavity {self.number}"
+
+    @property
+    def dose(self) -> float:
+        if not self.is_on:
+            return 0.0
+        dose = FE_COEFFICIENT * max(0.0, self.ades - FE_ONSET) ** 2
+        if self._quench_time is not None:
+            elapsed = time.monotonic() - self._quench_time
+            dose += QUENCH_DOSE * math.exp(-elapsed / QUENCH_DOSE_DECAY)
+        return dose
+
+    def turn_off(self):
+        self.is_on = False
+
+    def check_abort(self):
+        if self.abort_flag:
+            self.abort_flag = False
+            self.turn_off()
+            raise QuenchAbortError(f"Abort requested for {self}")
+        if self.scheduler:
+            self.scheduler.check_abort(self)
+        if self.decarad.max_raw_dose > self.radiation_limit:
+            raise QuenchAbortError("Max Radiation Dose Exceeded")
+
+    def wait(self, seconds, interval=None):
+        """
+        Sleep with abort checks, like QuenchCavity.wait.
+        """
+        interval = interval or max(seconds / 10, 0.001)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.check_abort()
+            time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+
+    def quench(self):
+        self.is_quenched = True
+        self.quench_count += 1
+        self.pre_quench_amp = self.ades
+        self._quench_time = time.monotonic()
+        self.quench_amp += CONDITIONING_GAIN
+
+    def settle(self, settle_time):
+        settling = self.scheduler.settling(self) if self.scheduler else None
+        if settling:
+            with settling:
+                self.wait(settle_time)
+        else:
+            self.wait(settle_time)
+        self.is_quenched = False
+
+    def quench_process(
+        self,
+        start_amp=10.0,
+        end_amp=21.0,
+        step_size=0.2,
+        step_time=0.1,
+        settle_time=0.03,
+        max_quenches=100,
+        ramp=None,
+    ):
+        """
+        :param ramp: AdaptiveRamp choosing each step, fixed steps if None
+        """
+        self.is_on = True
+        self.ades = start_amp
+
+        while self.ades < end_amp:
+            self.check_abort()
+            if self.scheduler:
+                self.scheduler.wait_for_step(self)
+            hold = step_time
+            if ramp:
+                size, hold = ramp.next_step(
+                    self.ades, end_amp, self.decarad.max_raw_dose, self.pre_quench_amp
+                )
+                self.ades = min(self.ades + size, end_amp)
+            else:
+                self.ades = min(self.ades + step_size, end_amp)
+
+            # conditioning at this amplitude until it holds
+            while self.ades >= self.quench_amp:
+                self.quench()
+                if self.quench_count > max_quenches:
+                    raise QuenchAbortError(f"{self} quench processing failed")
+                self.settle(settle_time)
+
+            self.wait(hold)
+
+
+def make_cryomodule(n_cavities=8, seed=0, radiation_limit=SIM_RADIATION_LIMIT):
+    """
+    :return: list of SimCavity sharing one SimDecarad, with quench amplitudes
+        spread between 14 and 20 MV
+    """
+    rng = np.random.default_rng(seed)
+    decarad = SimDecarad()
+    return [
+        SimCavity(number, decarad, float(rng.uniform(14, 20)), radiation_limit)
+        for number in range(1, n_cavities + 1)
+    ]
+
+
+def run_campaign(n_cavities, max_concurrent, seed=0, **kwargs):
+    """
+    :param max_concurrent: 0 runs the cavities one after another without a scheduler
+    :return: (wall time in s, peak dose, dict of cavity -> None or exception)
+    """
+    cavities = make_cryomodule(n_cavities, seed)
+    decarad = cavities[0].decarad
+    start = time.monotonic()
+
+    if max_concurrent:
+        scheduler = QuenchScheduler(
+            cavities,
+            max_concurrent=max_concurrent,
+            radiation_limit=SIM_RADIATION_LIMIT,
+            step_spacing=QUENCH_DOSE_DECAY,
+            poll_interval=0.005,
+            step_timeout=30,
+        )
+        results = scheduler.run(**kwargs)
+    else:
+        results = {}
+        for cavity in cavities:
+            try:
+                cavity.quench_process(**kwargs)
+                results[cavity] = None
+            except Exception as e:
+                results[cavity] = e
+                break
+
+    return time.monotonic() - start, decarad.peak_dose, results
+
+
+def compare_ramps(n_cavities, seed=0, step_size=0.2, step_time=0.1, **kwargs):
+    """
+    Process each cavity on its own, once with fixed steps and once with an
+    AdaptiveRamp, and print how long each took.
+
+    :return: (total fixed time, total adaptive time) in s
+    """
+    totals = {"fixed": 0.0, "adaptive": 0.0}
+    for mode in totals:
+        for cavity in make_cryomodule(n_cavities, seed):
+            ramp = None
+            if mode == "adaptive":
+                # same 3x faster holds as the real FAST_STEP_TIME vs STEP_TIME
+                ramp = AdaptiveRamp(
+                    step_size,
+                    step_time,
+                    fast_step_time=step_time / 3,
+                    radiation_limit=cavity.radiation_limit,
+                    ades_max=cavity.ades_max,
+                )
+            start = time.monotonic()
+            cavity.quench_process(
+                step_size=step_size, step_time=step_time, ramp=ramp, **kwargs
+            )
+            elapsed = time.monotonic() - start
+            totals[mode] += elapsed
+            print(
+                f"{mode} {cavity}: {elapsed:.2f}s, {cavity.quench_count} quenches, "
+                f"peak dose {cavity.decarad.peak_dose:.3f}"
+            )
+            cavity.turn_off()
+    print(f"fixed: {totals['fixed']:.2f}s, adaptive: {totals['adaptive']:.2f}s")
+    return totals["fixed"], totals["adaptive"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated quench processing campaign")
+    parser.add_argument("--cavities", type=int, default=8)
+    parser.add_argument("--concurrent", type=int, default=8)
+    parser.add_argument("--end-amp", type=float, default=21.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--compare-ramps", action="store_true", help="fixed vs adaptive steps per cavity"
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare_ramps:
+        compare_ramps(args.cavities, args.seed, end_amp=args.end_amp)
+        return
+
+    for label, concurrent in (("sequential", 0), ("scheduled", args.concurrent)):
+        elapsed, peak_dose, results = run_campaign(
+            args.cavities, concurrent, args.seed, end_amp=args.end_amp
+        )
+        failed = {str(cavity): str(error) for cavity, error in results.items() if error}
+        print(
+            f"{label}: {elapsed:.2f}s, peak dose {peak_dose:.3f} "
+            f"(limit {SIM_RADIATION_LIMIT}), failed: {failed or 'none'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Synthetic QUENCH dump generator.
+
+Writes dump files in the same "<PV> <timestamp> <samples...>" layout the
+parser reads, with any number of cavities, events and samples per waveform.
+Every event is either a real quench (the decay runs at a dropped loaded Q) or
+a fake one (the decay runs at the saved loaded Q), and the true values are
+returned so fits can be checked against them.
+
+Example:
+    python quench_synth.py synth_QUENCH.txt --cavities 8 --events 4 --samples 16384
+"""
+
+import argparse
+import datetime
+import json
+
+import numpy as np
+
+from quench_fit import LOADED_Q_CHANGE_FOR_QUENCH, cavity_frequency
+from quench_parser import SIGNALS
+
+# cryomodules per linac, used to hand out realistic PV names
+LINAC_CRYOMODULES = {
+    "L0B": ["01"],
+    "L1B": ["02", "03", "H1", "H2"],
+    "L2B": [f"{cm:02d}" for cm in range(4, 16)],
+    "L3B": [f"{cm:02d}" for cm in range(16, 36)],
+}
+
+# loaded Q of a real quench as a fraction of the saved loaded Q
+REAL_QUENCH_Q_DROP = 0.3
+
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H:%M:%S.%f"
+
+
+def cavity_prefixes(n_cavities):
+    """
+    First n_cavities PV prefixes in machine order, e.g. ACCL:L0B:0110.
+    """
+    prefixes = []
+    for linac, cryomodules in LINAC_CRYOMODULES.items():
+        for cm in cryomodules:
+            for cav in range(1, 9):
+                prefixes.append((f"ACCL:{linac}:{cm}{cav}0", cm))
+                if len(prefixes) == n_cavities:
+                    return prefixes
+    raise ValueError(f"Only {len(prefixes)} cavities in the machine")
+
+
+def synth_event(
+    n_samples=16384,
+    saved_loaded_q=4e7,
+    frequency=1.3e9,
+    pre_quench_amp=16.0,
+    real=True,
+    noise=0.002,
+    rng=None,
+    t_start=-0.01,
+    t_end=0.05,
+):
+    """
+    Make the waveforms of one fault.
+
+    :return: dict of signal name -> float64 array (time, cavity, forward,
+        reverse, decay) and the loaded Q the cavity decay was generated with
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    loaded_q = saved_loaded_q * (REAL_QUENCH_Q_DROP if real else 1.0)
+
+    time_data = np.linspace(t_start, t_end, n_samples)
+    after = np.clip(time_data, 0, None)
+    before = time_data < 0
+
+    def decay(q):
+        return pre_quench_amp * np.exp(-np.pi * frequency * after / q)
+
+    cavity = decay(loaded_q)
+    reference = decay(saved_loaded_q)
+    forward = np.where(before, 0.5 * pre_quench_amp, 0.0)
+    reverse = np.where(before, 0.05 * pre_quench_amp, cavity * 0.5)
+
+    def noisy(data):
+        return data * (1 + noise * rng.standard_normal(n_samples))
+
+    return {
+        "time": time_data,
+        "cavity": noisy(cavity),
+        "forward": noisy(forward),
+        "reverse": noisy(reverse),
+        "decay": reference,
+    }, loaded_q
+
+
+def _write_section(file, pv, timestamp, data, values_per_line):
+    if values_per_line is None:
+        values_per_line = len(data)
+    for start in range(0, max(len(data), 1), max(values_per_line, 1)):
+        chunk = data[start : start + values_per_line]
+        file.write(f"{pv} {timestamp} {' '.join(f'{value:.6g}' for value in chunk)}\n")
+
+
+def write_dump(
+    filename,
+    n_cavities=1,
+    n_events=1,
+    n_samples=16384,
+    noise=0.002,
+    real_fraction=0.5,
+    values_per_line=None,
+    seed=0,
+    start_time=datetime.datetime(2022, 6, 30, 16, 49, 5, 440831),
+):
+    """
+    Write a synthetic dump and return the truth for every event.
+
+    :param n_cavities: cavities per event, each contributes 5 PVs
+    :param n_events: fault timestamps in the file
+    :param values_per_line: split each waveform across lines (None = one line)
+    :return: list of dicts with pv_prefix, timestamp, is_real, loaded_q,
+        saved_loaded_q and frequency
+    """
+    rng = np.random.default_rng(seed)
+    truth = []
+
+    with open(filename, "w") as file:
+        for event in range(n_events):
+            timestamp = (start_time + datetime.timedelta(minutes=event)).strftime(
+                TIMESTAMP_FORMAT
+            )
+            for pv_prefix, cm in cavity_prefixes(n_cavities):
+                frequency = cavity_frequency(cm)
+                saved_loaded_q = rng.uniform(2e7, 6e7)
+                real = bool(rng.random() < real_fraction)
+                waveforms, loaded_q = synth_event(
+                    n_samples=n_samples,
+                    saved_loaded_q=saved_loaded_q,
+                    frequency=frequency,
+                    pre_quench_amp=rng.uniform(10, 20),
+                    real=real,
+                    noise=noise,
+                    rng=rng,
+                )
+                for name, suffix in SIGNALS.items():
+                    _write_section(
+                        file,
+                        f"{pv_prefix}:{suffix}",
+                        timestamp,
+                        waveforms[name],
+                        values_per_line,
+                    )
+                truth.append(
+                    {
+                        "pv_prefix": pv_prefix,
+                        "timestamp": timestamp,
+                        "is_real": real,
+                        "loaded_q": loaded_q,
+                        "saved_loaded_q": saved_loaded_q,
+                        "frequency": frequency,
+                        "threshold": LOADED_Q_CHANGE_FOR_QUENCH * saved_loaded_q,
+                    }
+                )
+
+    return truth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic QUENCH dump")
+    parser.add_argument("filename")
+    parser.add_argument("--cavities", type=int, default=1)
+    parser.add_argument("--events", type=int, default=1)
+    parser.add_argument("--samples", type=int, default=16384)
+    parser.add_argument("--noise", type=float, default=0.002)
+    parser.add_argument("--real-fraction", type=float, default=0.5)
+    parser.add_argument("--values-per-line", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--truth", help="also write the event truth to this JSON file")
+    args = parser.parse_args(argv)
+
+    truth = write_dump(
+        args.filename,
+        n_cavities=args.cavities,
+        n_events=args.events,
+        n_samples=args.samples,
+        noise=args.noise,
+        real_fraction=args.real_fraction,
+        values_per_line=args.values_per_line,
+        seed=args.seed,
+    )
+    print(f"Wrote {len(truth)} events to {args.filename}")
+
+    if args.truth:
+        with open(args.truth, "w") as file:
+            json.dump(truth, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Long-running watcher that triages fault dumps as they land.
+
+Polls a directory for new or growing *_QUENCH.txt files and only parses the
+bytes added since the last poll. Each completed fault event is fit for loaded
+Q, scored real/fake when a saved loaded Q is available, plotted headlessly and
+appended to a JSON lines results file. Progress (byte offset per file) is
+saved to a state file so a restart picks up where it left off.
+
+Sections of the newest fault timestamp in a file are held back until either a
+later timestamp shows up or the file stops changing, so an event that is only
+half written is never processed.
+
+Example:
+    python quench_watch.py /data/faults/ --output-dir triage/ --saved-q saved_q.json
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import time
+
+from quench_fit import cavity_frequency, fit_loaded_q, is_real_quench
+from quench_parser import SIGNALS, cavity_location, iter_sections_from, split_pv
+from quench_replay import SAVED_Q_SUFFIX, load_saved_q
+
+DEFAULT_INTERVAL = 5.0
+STATE_NAME = "quench_watch_state.json"
+RESULTS_NAME = "quench_watch_results.jsonl"
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_state(path, state):
+    # write and rename so a crash never leaves a half written state file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_new_events(filename, offset, settled):
+    """
+    Parse the complete sections added to filename since offset.
+
+    :param settled: the file has not changed since the last poll, so its last
+        event is complete too, down to a last line with no newline
+    :return: (dict of (pv_prefix, timestamp) -> {signal name: data}, new offset)
+    """
+    sections = list(
+        iter_sections_from(filename, offset, complete_lines_only=not settled)
+    )
+    if not sections:
+        return {}, offset
+
+    if not settled:
+        # hold back the trailing run of sections with the newest timestamp
+        last_timestamp = sections[-1][1]
+        keep = len(sections)
+        while keep > 0 and sections[keep - 1][1] == last_timestamp:
+            keep -= 1
+        if keep == 0:
+            return {}, offset
+        sections = sections[:keep]
+
+    suffixes = {suffix: name for name, suffix in SIGNALS.items()}
+    suffixes[SAVED_Q_SUFFIX.lstrip(":")] = "saved_q"
+
+    events = {}
+    for pv, timestamp, data, _, _ in sections:
+        pv_prefix, suffix = split_pv(pv)
+        if suffix in suffixes:
+            events.setdefault((pv_prefix, timestamp), {})[suffixes[suffix]] = data
+
+    return events, sections[-1][4]
+
+
+def process_event(pv_prefix, timestamp, signals, saved_q, plotter=None, output_dir="."):
+    """
+    Fit, score and plot one fault event.
+
+    :return: result dict for the results file
+    """
+    result = {
+        "pv_prefix": pv_prefix,
+        "timestamp": timestamp,
+        "processed": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+    cavity_data = signals.get("cavity")
+    time_data = signals.get("time")
+    if cavity_data is None or not cavity_data.size:
+        result["status"] = "no cavity waveform"
+        return result
+
+    if time_data is not None and time_data.size:
+        try:
+            _, cryomodule, _ = cavity_location(pv_prefix)
+            loaded_q, pre_quench_amp = fit_loaded_q(
+                time_data, cavity_data, cavity_frequency(cryomodule)
+            )
+            result["loaded_q"] = float(loaded_q)
+            result["pre_quench_amp"] = float(pre_quench_amp)
+        except ValueError as e:
+            result["fit_error"] = str(e)
+
+    if signals.get("saved_q") is not None and signals["saved_q"].size:
+        saved_loaded_q = float(signals["saved_q"][0])
+    else:
+        saved_loaded_q = saved_q.get((pv_prefix, timestamp), saved_q.get(pv_prefix))
+
+    if saved_loaded_q is not None and "loaded_q" in result:
+        result["saved_loaded_q"] = saved_loaded_q
+        result["is_real"] = bool(is_real_quench(result["loaded_q"], saved_loaded_q))
+
+    plot_signals = {
+        name: signals[name]
+        for name in ("cavity", "forward", "reverse", "decay")
+        if name in signals and signals[name].size
+    }
+    if plotter is not None:
+        plot_filename = os.path.join(
+            output_dir,
+            f"combined_{pv_prefix.replace(':', '_')}_{timestamp.replace(':', '')}.png",
+        )
+        plotter.plot_event(plot_signals, f"Quench Waveforms - {pv_prefix} {timestamp}")
+        plotter.save(plot_filename)
+        result["plot"] = plot_filename
+
+    result["status"] = "ok"
+    return result
+
+
+class QuenchWatcher:
+    def __init__(
+        self,
+        directory,
+        output_dir,
+        pattern="*_QUENCH.txt",
+        saved_q=None,
+        plot=True,
+        state_path=None,
+    ):
+        self.directory = directory
+        self.output_dir = output_dir
+        self.pattern = pattern
+        self.saved_q = saved_q or {}
+        self.state_path = state_path or os.path.join(output_dir, STATE_NAME)
+        self.results_path = os.path.join(output_dir, RESULTS_NAME)
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.state = load_state(self.state_path)
+
+        self.plotter = None
+        if plot:
+            from quench_plot import QuenchPlotter
+
+            self.plotter = QuenchPlotter(headless=True)
+
+    def poll(self) -> int:
+        """
+        Process whatever is new in the directory.
+
+        :return: number of events processed
+        """
+        processed = 0
+        for filename in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+
+            path = os.path.abspath(filename)
+            file_state = self.state.get(path, {"offset": 0, "size": -1, "mtime": 0})
+
+            if stat.st_size < file_state["offset"]:
+                print(f"{filename} shrank, reprocessing from the start")
+                file_state = {"offset": 0, "size": -1, "mtime": 0}
+
+            settled = (
+                stat.st_size == file_state["size"]
+                and stat.st_mtime == file_state["mtime"]
+            )
+            if settled and file_state["offset"] >= stat.st_size:
+                continue
+
+            events, offset = read_new_events(filename, file_state["offset"], settled)
+            for (pv_prefix, timestamp), signals in events.items():
+                result = process_event(
+                    pv_prefix,
+                    timestamp,
+                    signals,
+                    self.saved_q,
+                    self.plotter,
+                    self.output_dir,
+                )
+                result["file"] = path
+                with open(self.results_path, "a") as file:
+                    file.write(json.dumps(result) + "\n")
+                print(f"{result['status']}: {pv_prefix} {timestamp} {result.get('is_real', '')}")
+                processed += 1
+
+            file_state = {"offset": offset, "size": stat.st_size, "mtime": stat.st_mtime}
+            self.state[path] = file_state
+            save_state(self.state_path, self.state)
+
+        return processed
+
+    def run(self, interval=DEFAULT_INTERVAL):
+        print(f"Watching {os.path.join(self.directory, self.pattern)} every {interval}s")
+        while True:
+            start = time.monotonic()
+            self.poll()
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Triage fault dumps as they arrive")
+    parser.add_argument("directory")
+    parser.add_argument("-o", "--output-dir", default="quench_watch_output")
+    parser.add_argument("--pattern", default="*_QUENCH.txt")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    parser.add_argument("--saved-q", help="JSON table of saved loaded Q values")
+    parser.add_argument("--state", help="progress file, defaults to one in the output dir")
+    parser.add_argument("--no-plot", action="store_true")
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    args = parser.parse_args(argv)
+
+    watcher = QuenchWatcher(
+        args.directory,
+        args.output_dir,
+        pattern=args.pattern,
+        saved_q=load_saved_q(args.saved_q),
+        plot=not args.no_plot,
+        state_path=args.state,
+    )
+    if args.once:
+        print(f"Processed {watcher.poll()} events")
+    else:
+        watcher.run(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,22 @@
-import matplotlib.pyplot as plt
 import numpy as np
-import re # importing regular expression module
+
+from quench_cache import cached_read_waveforms
 
 # changes with each file
 filename = 'ACCL_L3B_3180_20220630_164905_QUENCH.txt'   # imput data file
-timestamp = '2022-06-30_16:49:05.440831'                # waveform timestamp 
+timestamp = '2022-06-30_16:49:05.440831'                # waveform timestamp, None plots every fault in the file
+headless = False                                        # True renders without a display and never blocks
 
 # PV or fault string to search for and precise timestamp of the waveform
-cavity_faultname = 'ACCL:L3B:3180:CAV:FLTAWF'    # cavity details 
-forward_pow = 'ACCL:L3B:3180:FWD:FLTAWF'         # forward power details
-reverse_pow = 'ACCL:L3B:3180:REV:FLTAWF'         # reverse power details
-decay_ref = 'ACCL:L3B:3180:DECAYREFWF'           # decay reference details
-
-# read the entire file into memory
-with open(filename,'r') as file:
-    lines = file.readlines()
-
-def extract_data(lines, faultname, timestamp):
-    # initilization: find the section of interest based on keywords 
-    search_string = f"{faultname} {timestamp}"
-    data_lines = []
-
-    # flag to indicate that we are in the right section
-    in_section = False
-
-    # loop through lines to find the section matching the fault and timestamp
-    for i, line in enumerate(lines):
-        if search_string in line:
-            in_section = True
-            print(f"Found section start at line {i}")
-        elif in_section and faultname not in line:
-            print(f"Found section end at line {i}")
-            break
-        if in_section:
-            data_part = line.split(timestamp, 1)[-1].strip()    # removes the timestamp and label
-            data_lines.append(data_part)                        # extracting data lines
-
-    # extracting numeric data from each line using regular expressions
-    data = []
-    for line in data_lines:
-        # using regex to find all numbers in the line 
-        numbers = re.findall(r"[-+]?\d*\.\d+|\d+", line) # matches integers or floats
-        if numbers:
-            # convering the first number found to float and add it to data list
-            # data.append([float(num) for num in numbers])  # add all numbers in the line to data
-            data.extend([float(num) for num in numbers])    # flattening the data list (extend vs append)
-        else:
-            print(f"Skipping line with no numeric data: {line}")
+cavity_prefix = 'ACCL:L3B:3180'                  # cavity details
+cavity_suffix = 'CAV:FLTAWF'                     # cavity waveform
+forward_suffix = 'FWD:FLTAWF'                    # forward power details
+reverse_suffix = 'REV:FLTAWF'                    # reverse power details
+decay_suffix = 'DECAYREFWF'                      # decay reference details
+
+
+def extract_data(waveforms, faultname, timestamp):
+    data = waveforms[(faultname, timestamp)]
 
     # diagnostic check for data content and confirming proper structure
     print("\n== Data Diagnostics ===")
@@ -62,55 +32,96 @@ def extract_data(lines, faultname, timestamp):
     print(f"Extracted {len(data)} points from {faultname}\n")
     return data
 
-# extract each waveform
-cavity_data = extract_data(lines, cavity_faultname, timestamp)
-forward_data = extract_data(lines, forward_pow, timestamp)
-reverse_data = extract_data(lines, reverse_pow, timestamp)
-decay_data = extract_data(lines, decay_ref, timestamp)
-
-# finding the lengths of all waveforms
-lengths = {
-    'cavity': len(cavity_data),
-    'forward': len(forward_data),
-    'reverse': len(reverse_data),
-    'decay': len(decay_data)
-}
-
-for name, length in lengths.items():
-    print(f"{name} data points: {length}")
-
-# finding the minimum length 
-min_length = min(lengths.values())
-print(f"\nMinimum number of data points across all waveforms: {min_length}")
-
-# trimming decay_data to cavity length because they must be the same length in order to plot
-cavity_data = cavity_data[:min_length]
-forward_data = forward_data[:min_length]
-reverse_data = reverse_data[:min_length]
-decay_data = decay_data[:min_length]
-
-# plotting them all on the same axes
-time_range = list(range(min_length))
-
-# plot setup
-plt.figure(figsize=(14,6))
-plt.plot(time_range, cavity_data, label = "Cavity", color = 'blue')
-plt.plot(time_range, forward_data, label = "Forward Power", color = 'green')
-plt.plot(time_range, reverse_data, label = "Reverse Power", color = 'red')
-plt.scatter(time_range, decay_data, label = "Normal Cavity Decay Reference", color = 'cyan', s=1, marker='o')
-
-# plot formatting
-plt.xlabel('Number of Data Points')
-plt.ylabel('MV')
-plt.title(f'Quench Waveforms - {cavity_faultname} {timestamp}')
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-
-# save the plot to file
-plot_filename = f"combined_{filename.replace('.txt',"")}.png"
-plt.savefig(plot_filename)
-print(f"Plot saved as: {plot_filename}")
-
-# show plot 
-plt.show()
+
+def load_waveforms(filename=filename, timestamp=timestamp, cavity_prefix=cavity_prefix):
+    """
+    Read the cavity, forward, reverse and decay reference waveforms of one
+    fault, trimmed to a common length. Nothing is read or plotted on import,
+    so this can be used from other modules.
+
+    :return: dict of 'cavity', 'forward', 'reverse', 'decay' -> float64 ndarray
+    """
+    pvs = {
+        'cavity': f"{cavity_prefix}:{cavity_suffix}",
+        'forward': f"{cavity_prefix}:{forward_suffix}",
+        'reverse': f"{cavity_prefix}:{reverse_suffix}",
+        'decay': f"{cavity_prefix}:{decay_suffix}",
+    }
+
+    # stream the file once and pull out only the sections we need, or load them
+    # from the binary cache if this file was parsed before
+    waveforms = cached_read_waveforms(filename, [(pv, timestamp) for pv in pvs.values()])
+
+    # extract each waveform
+    data = {name: extract_data(waveforms, pv, timestamp) for name, pv in pvs.items()}
+
+    for name, values in data.items():
+        print(f"{name} data points: {len(values)}")
+
+    # finding the minimum length
+    min_length = min(len(values) for values in data.values())
+    print(f"\nMinimum number of data points across all waveforms: {min_length}")
+
+    # trimming to the shortest waveform because they must be the same length in order to plot
+    return {name: values[:min_length] for name, values in data.items()}
+
+
+def plot_all_events(filename=filename):
+    """
+    Plot every fault recorded in the file without knowing its timestamps.
+    """
+    from quench_events import read_events
+    from quench_plot import QuenchPlotter
+
+    events = read_events(filename)
+    print(f"Found {len(events['timestamp'])} fault events in {filename}")
+
+    names = ['cavity', 'forward', 'reverse', 'decay']
+    plotter = QuenchPlotter(headless=headless)
+    for idx, (prefix, event_timestamp) in enumerate(
+        zip(events['pv_prefix'], events['timestamp'])
+    ):
+        # trimmed to the shortest waveform of this event, like load_waveforms
+        min_length = min(events['lengths'][name][idx] for name in names)
+        data = {name: events['signals'][name][idx, :min_length] for name in names}
+        plotter.plot_event(
+            data,
+            f'Quench Waveforms - {prefix}:{cavity_suffix} {event_timestamp}',
+            time_axis=np.arange(min_length),
+        )
+        plotter.save(f"combined_{filename.replace('.txt','')}_{idx}.png")
+
+    plotter.show()
+
+
+def main():
+    if timestamp is None:
+        plot_all_events(filename)
+        return
+
+    data = load_waveforms(filename, timestamp, cavity_prefix)
+
+    # plotting them all on the same axes
+    time_range = np.arange(len(data['cavity']))
+
+    # matplotlib is only imported once we actually plot
+    from quench_plot import QuenchPlotter
+
+    # plot setup: decimated to screen resolution, decay reference drawn as line markers
+    plotter = QuenchPlotter(headless=headless)
+    plotter.plot_event(
+        data,
+        f'Quench Waveforms - {cavity_prefix}:{cavity_suffix} {timestamp}',
+        time_axis=time_range,
+    )
+
+    # save the plot to file
+    plot_filename = f"combined_{filename.replace('.txt','')}.png"
+    plotter.save(plot_filename)
+
+    # show plot (does nothing when headless)
+    plotter.show()
+
+
+if __name__ == "__main__":
+    main()
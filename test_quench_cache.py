@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+import quench_cache
+from quench_cache import cache_path, cached_read_waveforms
+from quench_synth import write_dump
+
+
+def dump_keys(filename, n_cavities=2):
+    truth = write_dump(filename, n_cavities=n_cavities, n_samples=256)
+    return [(f"{event['pv_prefix']}:CAV:FLTAWF", event["timestamp"]) for event in truth]
+
+
+def test_unwritable_cache_still_returns_waveforms(tmp_path):
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    keys = dump_keys(filename)
+    # a regular file where the cache directory should go cannot be written into
+    blocked = tmp_path / "blocked"
+    blocked.write_text("")
+
+    waveforms = cached_read_waveforms(
+        filename, keys, cache_dir=str(blocked / "cache"), verbose=False
+    )
+
+    assert all(waveforms[key].size == 256 for key in keys)
+
+
+def test_second_read_comes_from_cache(tmp_path, monkeypatch):
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    keys = dump_keys(filename)
+    parsed = cached_read_waveforms(filename, keys, verbose=False)
+
+    monkeypatch.setattr(
+        quench_cache,
+        "read_waveforms",
+        lambda *args, **kwargs: pytest.fail("parsed a cached dump"),
+    )
+    cached = cached_read_waveforms(filename, keys, verbose=False)
+
+    assert os.path.exists(cache_path(filename))
+    for key in keys:
+        assert np.array_equal(cached[key], parsed[key])
+
+
+def test_rewritten_dump_invalidates_cache(tmp_path):
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    keys = dump_keys(filename, n_cavities=1)
+    cached_read_waveforms(filename, keys, verbose=False)
+    old_path = cache_path(filename)
+
+    # more cavities, so the size changes even if the mtime does not
+    keys = dump_keys(filename, n_cavities=2)
+    waveforms = cached_read_waveforms(filename, keys, verbose=False)
+
+    assert cache_path(filename) != old_path
+    assert not os.path.exists(old_path)
+    assert os.listdir(os.path.dirname(old_path)) == [
+        os.path.basename(cache_path(filename))
+    ]
+    assert all(waveforms[key].size == 256 for key in keys)
+
+
+def test_absent_keys_are_cached(tmp_path, monkeypatch):
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    keys = dump_keys(filename)
+    missing = ("ACCL:L0B:0110:CAV:FLTAWF", "2000-01-01_00:00:00")
+    cached_read_waveforms(filename, keys + [missing], verbose=False)
+
+    monkeypatch.setattr(
+        quench_cache,
+        "read_waveforms",
+        lambda *args, **kwargs: pytest.fail("parsed a key known to be absent"),
+    )
+    waveforms = cached_read_waveforms(filename, [missing], verbose=False)
+
+    assert waveforms[missing].size == 0
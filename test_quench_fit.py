@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from quench_fit import fit_loaded_q, fit_loaded_q_batch
+from quench_synth import synth_event
+
+FREQUENCY = 1.3e9
+
+
+def polyfit_loaded_q(time_data, fault_data, frequency):
+    """
+    The loops and np.polyfit validate_quench used before the closed form fit.
+    """
+    for time_0, timestamp in enumerate(time_data):
+        if timestamp >= 0:
+            break
+    fault_data = fault_data[time_0:]
+    time_data = time_data[time_0:]
+
+    end_decay = len(fault_data) - 1
+    for end_decay, amp in enumerate(fault_data):
+        if amp < 0.002:
+            break
+    fault_data = fault_data[:end_decay]
+    time_data = time_data[:end_decay]
+
+    pre_quench_amp = fault_data[0]
+    exponential_term = np.polyfit(time_data, np.log(pre_quench_amp / fault_data), 1)[0]
+    return (np.pi * frequency) / exponential_term, pre_quench_amp
+
+
+def synth_waveforms(n_events, n_samples=2048, seed=0):
+    rng = np.random.default_rng(seed)
+    events = [
+        synth_event(
+            n_samples=n_samples, saved_loaded_q=4e7, real=bool(idx % 2), rng=rng
+        )[0]
+        for idx in range(n_events)
+    ]
+    return [event["time"] for event in events], [event["cavity"] for event in events]
+
+
+@pytest.mark.parametrize("real", [True, False])
+def test_matches_polyfit(real):
+    waveforms, true_loaded_q = synth_event(
+        n_samples=4096, saved_loaded_q=4e7, real=real, rng=np.random.default_rng(2)
+    )
+
+    loaded_q, pre_quench_amp = fit_loaded_q(
+        waveforms["time"], waveforms["cavity"], FREQUENCY
+    )
+    expected_q, expected_amp = polyfit_loaded_q(
+        waveforms["time"], waveforms["cavity"], FREQUENCY
+    )
+
+    assert loaded_q == pytest.approx(expected_q, rel=1e-9)
+    assert pre_quench_amp == expected_amp
+    assert loaded_q == pytest.approx(true_loaded_q, rel=0.01)
+
+
+def test_without_decay_fits_to_the_end():
+    time_data = np.linspace(-1e-3, 4e-3, 500)
+    # decays, but never below DECAY_END_AMP
+    fault_data = 16 * np.exp(-np.pi * FREQUENCY * np.clip(time_data, 0, None) / 4e7)
+    assert fault_data.min() > 0.002
+
+    loaded_q, _ = fit_loaded_q(time_data, fault_data, FREQUENCY)
+
+    expected_q, _ = polyfit_loaded_q(time_data, fault_data, FREQUENCY)
+    assert loaded_q == pytest.approx(expected_q)
+    assert loaded_q == pytest.approx(4e7)
+
+
+def test_without_time_0_cannot_fit():
+    time_data = np.linspace(-2e-3, -1e-3, 100)
+    fault_data = np.full(100, 16.0)
+
+    with pytest.raises(ValueError):
+        fit_loaded_q(time_data, fault_data, FREQUENCY)
+    assert np.isnan(fit_loaded_q_batch([time_data], [fault_data], FREQUENCY)[0][0])
+
+
+def test_fewer_than_two_decay_samples_cannot_fit():
+    time_data = np.array([-1.0, 0.0, 1.0, 2.0])
+    fault_data = np.array([16.0, 16.0, 0.001, 0.001])
+
+    with pytest.raises(ValueError, match="Only 1 samples"):
+        fit_loaded_q(time_data, fault_data, FREQUENCY)
+
+
+def test_batch_matches_single_fits():
+    time_waveforms, fault_waveforms = synth_waveforms(6)
+    # rows of different lengths exercise the padding
+    time_waveforms[2] = time_waveforms[2][:1500]
+
+    loaded_qs, pre_quench_amps = fit_loaded_q_batch(
+        time_waveforms, fault_waveforms, FREQUENCY
+    )
+
+    for idx, (time_data, fault_data) in enumerate(zip(time_waveforms, fault_waveforms)):
+        loaded_q, pre_quench_amp = fit_loaded_q(
+            time_data, fault_data[: len(time_data)], FREQUENCY
+        )
+        assert np.isclose(loaded_qs[idx], loaded_q, rtol=1e-9)
+        assert pre_quench_amps[idx] == pre_quench_amp
+
+
+def test_batch_disconnected_and_empty_rows_are_nan():
+    time_waveforms, fault_waveforms = synth_waveforms(2)
+    time_waveforms += [None, np.empty(0)]
+    fault_waveforms += [np.ones(10), None]
+
+    loaded_qs, pre_quench_amps = fit_loaded_q_batch(
+        time_waveforms, fault_waveforms, FREQUENCY
+    )
+
+    assert np.isfinite(loaded_qs[:2]).all()
+    assert np.isnan(loaded_qs[2:]).all()
+    assert np.isnan(pre_quench_amps[2:]).all()
+
+
+def test_batch_all_rows_empty():
+    loaded_qs, pre_quench_amps = fit_loaded_q_batch(
+        [np.empty(0), None], [np.empty(0), np.empty(0)], FREQUENCY
+    )
+
+    assert loaded_qs.shape == pre_quench_amps.shape == (2,)
+    assert np.isnan(loaded_qs).all()
+    assert np.isnan(pre_quench_amps).all()
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from quench_monitor import QuenchMonitor
+from quench_pv_fetch import FakePV
+
+
+def test_predicate_is_tested_before_on_wake():
+    monitor = QuenchMonitor()
+    latch = FakePV("TEST:QUENCH_LTCH", 1)
+    monitor.subscribe(latch, "cavity")
+
+    def on_wake():
+        raise AssertionError("on_wake ran although the predicate was already true")
+
+    # give the dispatcher the seeded value
+    time.sleep(0.05)
+    assert monitor.wait_until(
+        "cavity", lambda: monitor.value(latch.pvname) == 1, 1.0, on_wake=on_wake
+    )
+
+
+def test_wakes_on_pushed_update():
+    monitor = QuenchMonitor()
+    latch = FakePV("TEST:QUENCH_LTCH", 0)
+    monitor.subscribe(latch, "cavity")
+    wakes = []
+
+    threading.Timer(0.1, latch.put, args=(1,)).start()
+    start = time.monotonic()
+    assert monitor.wait_until(
+        "cavity",
+        lambda: monitor.value(latch.pvname) == 1,
+        5.0,
+        on_wake=lambda: wakes.append(1),
+    )
+    assert time.monotonic() - start < 1.0
+    assert wakes
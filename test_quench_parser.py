@@ -0,0 +1,125 @@
+import numpy as np
+
+import quench_parser
+from quench_parser import (
+    _scan_sections,
+    decode_section,
+    index_sections,
+    iter_sections,
+    list_sections,
+    read_sections,
+    read_waveforms,
+)
+from quench_synth import write_dump
+
+
+def test_index_reads_match_streaming_reads(tmp_path):
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    write_dump(filename, n_cavities=3, n_events=2, n_samples=300, values_per_line=64)
+
+    index = index_sections(filename)
+    keys = list(index) + [("ACCL:L0B:0110:CAV:FLTAWF", "2000-01-01_00:00:00")]
+    indexed = read_sections(filename, index, keys)
+    streamed = read_waveforms(filename, keys, verbose=False)
+
+    # 3 cavities x 2 events x 5 signals
+    assert len(index) == 30
+    for key in keys:
+        assert np.array_equal(indexed[key], streamed[key])
+    assert indexed[keys[-1]].size == 0
+
+
+def test_index_offsets_cover_each_section(tmp_path):
+    filename = tmp_path / "small_QUENCH.txt"
+    filename.write_text(
+        "ACCL:L0B:0110:CAV:FLTAWF 2022-06-30_16:49:05.440831 1 2\n"
+        "ACCL:L0B:0110:CAV:FLTAWF 2022-06-30_16:49:05.440831 3\n"
+        "ACCL:L0B:0110:CAV:FLTTWF 2022-06-30_16:49:05.440831 -1 0 1\n"
+    )
+
+    index = index_sections(str(filename))
+    content = filename.read_bytes()
+
+    start, end = index[("ACCL:L0B:0110:CAV:FLTAWF", "2022-06-30_16:49:05.440831")]
+    assert content[start:end].count(b"\n") == 2
+    start, end = index[("ACCL:L0B:0110:CAV:FLTTWF", "2022-06-30_16:49:05.440831")]
+    assert end == len(content)
+    assert read_sections(str(filename), index, index)[
+        ("ACCL:L0B:0110:CAV:FLTAWF", "2022-06-30_16:49:05.440831")
+    ].tolist() == [1, 2, 3]
+
+
+def test_empty_file_has_empty_index(tmp_path):
+    filename = tmp_path / "empty_QUENCH.txt"
+    filename.write_text("")
+
+    assert index_sections(str(filename)) == {}
+    key = ("ACCL:L0B:0110:CAV:FLTAWF", "2022-06-30_16:49:05.440831")
+    assert read_sections(str(filename), {}, [key])[key].size == 0
+
+
+def test_decode_scientific_notation_and_specials():
+    data = decode_section(["1e-3 -2.5E+2 .5", "nan inf -inf 7"])
+
+    assert data.dtype == np.float64
+    assert np.array_equal(
+        data, [1e-3, -250.0, 0.5, np.nan, np.inf, -np.inf, 7.0], equal_nan=True
+    )
+
+
+def test_decode_commas():
+    assert decode_section(["1,2, 3", "4"]).tolist() == [1, 2, 3, 4]
+
+
+def test_decode_falls_back_to_regex_on_text():
+    data = decode_section(["1.5 2 units=MV", "NaN 3e2"])
+
+    assert np.array_equal(data, [1.5, 2.0, np.nan, 300.0], equal_nan=True)
+
+
+def test_decode_without_numbers_is_empty():
+    assert decode_section(["no samples here"]).size == 0
+
+
+def test_section_boundaries(tmp_path):
+    filename = tmp_path / "boundaries_QUENCH.txt"
+    filename.write_text(
+        "ACCL:L0B:0110:CAV:FLTAWF 2022-06-30_16:49:05.440831 1 2\n"
+        # continuation line carrying the PV but not the timestamp
+        "ACCL:L0B:0110:CAV:FLTAWF 3\n"
+        # a line without the PV ends the section
+        "# comment 99\n"
+        "ACCL:L0B:0110:CAV:FLTAWF 2022-06-30_16:50:05.440831 4\n"
+        # a new PV starts a new section straight away
+        "ACCL:L0B:0110:CAV:FLTTWF 2022-06-30_16:50:05.440831 5 6"
+    )
+
+    sections = {
+        (pv, timestamp): data.tolist()
+        for pv, timestamp, data in iter_sections(str(filename))
+    }
+
+    assert sections == {
+        ("ACCL:L0B:0110:CAV:FLTAWF", "2022-06-30_16:49:05.440831"): [1, 2, 3],
+        ("ACCL:L0B:0110:CAV:FLTAWF", "2022-06-30_16:50:05.440831"): [4],
+        ("ACCL:L0B:0110:CAV:FLTTWF", "2022-06-30_16:50:05.440831"): [5, 6],
+    }
+
+
+def test_stops_scanning_once_every_key_is_found(tmp_path, monkeypatch):
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    write_dump(filename, n_cavities=4, n_samples=16)
+    keys = list_sections(filename)
+
+    scanned = []
+
+    def counting_scan(*args, **kwargs):
+        for section in _scan_sections(*args, **kwargs):
+            scanned.append(section[:2])
+            yield section
+
+    monkeypatch.setattr(quench_parser, "_scan_sections", counting_scan)
+    waveforms = read_waveforms(filename, keys[:3], verbose=False)
+
+    assert len(scanned) == 3
+    assert all(waveforms[key].size == 16 for key in keys[:3])
@@ -0,0 +1,61 @@
+import threading
+
+from quench_pv_fetch import FakePVBackend, fetch_fault_data
+
+
+class FetchCavity:
+    def __init__(self, prefix, backend):
+        self.fault_waveform_pv = prefix + "CAV:FLTAWF"
+        self.fault_time_waveform_pv = prefix + "CAV:FLTTWF"
+        self.current_q_loaded_pv = prefix + "QLOADED"
+        self.quench_latch_pv = prefix + "QUENCH_LTCH"
+        self.decay_ref_pv = prefix + "DECAYREFWF"
+        backend.attach(self)
+
+    @property
+    def fault_waveform_pv_obj(self):
+        return self._fault_waveform_pv_obj
+
+    @property
+    def fault_time_waveform_pv_obj(self):
+        return self._fault_time_waveform_pv_obj
+
+    @property
+    def current_q_loaded_pv_obj(self):
+        return self._current_q_loaded_pv_obj
+
+    @property
+    def quench_latch_pv_obj(self):
+        return self._quench_latch_pv_obj
+
+    @property
+    def decay_ref_pv_obj(self):
+        return self._decay_ref_pv_obj
+
+
+def test_fetch_returns_one_tuple_per_cavity():
+    backend = FakePVBackend()
+    cavities = [FetchCavity(f"ACCL:L1B:02{cav}0:", backend) for cav in (1, 2)]
+    for idx, cavity in enumerate(cavities):
+        backend.set(cavity.fault_time_waveform_pv, [idx])
+        backend.set(cavity.fault_waveform_pv, [idx + 10])
+        backend.set(cavity.current_q_loaded_pv, 4e7 + idx)
+        backend.set(cavity.decay_ref_pv, [idx + 20])
+
+    assert fetch_fault_data(cavities) == [
+        ([0], [10], 4e7, [20]),
+        ([1], [11], 4e7 + 1, [21]),
+    ]
+
+
+def test_single_cavity_is_read_on_the_calling_thread():
+    backend = FakePVBackend()
+    cavity = FetchCavity("ACCL:L1B:0210:", backend)
+    threads = []
+    cavity._fault_waveform_pv_obj.get = lambda *args, **kwargs: threads.append(
+        threading.current_thread()
+    )
+
+    fetch_fault_data([cavity])
+
+    assert threads == [threading.current_thread()]
@@ -0,0 +1,24 @@
+from quench_ramp import AdaptiveRamp
+
+
+def ramp(**kwargs):
+    return AdaptiveRamp(0.2, 30, max_step_size=1.0, fast_step_time=10, **kwargs)
+
+
+def test_unknown_quench_amplitude_is_conservative():
+    assert ramp(radiation_limit=2).next_step(5, 21, 0) == (0.2, 30)
+
+
+def test_unknown_quench_amplitude_capped_by_ades_max():
+    adaptive = ramp(radiation_limit=2, ades_max=20, unknown_quench_fraction=0.5)
+    assert adaptive.next_step(5, 21, 0) == (1.0, 10)
+    step_size, step_time = adaptive.next_step(9.5, 21, 0)
+    assert (round(step_size, 6), step_time) == (0.5, 10)
+    assert adaptive.next_step(9.9, 21, 0) == (0.2, 30)
+
+
+def test_fast_step_stops_at_approach_margin():
+    adaptive = ramp(radiation_limit=2, approach_margin=1.0)
+    step_size, step_time = adaptive.next_step(14.6, 21, 0, pre_quench_amp=16)
+    assert (round(step_size, 6), step_time) == (0.4, 10)
+    assert adaptive.next_step(14.9, 21, 0, pre_quench_amp=16) == (0.2, 30)
@@ -0,0 +1,146 @@
+import json
+import math
+
+import pytest
+
+from quench_replay import load_saved_q, replay_file
+from quench_synth import write_dump
+
+
+def synth_dump(tmp_path, without=None, n_cavities=4):
+    """
+    Write a small synthetic dump, dropping every section whose PV contains
+    without.
+
+    :return: (filename, truth from write_dump, saved loaded Q table)
+    """
+    filename = str(tmp_path / "synth_QUENCH.txt")
+    truth = write_dump(filename, n_cavities=n_cavities, n_samples=1024, seed=1)
+    if without:
+        with open(filename) as file:
+            lines = [line for line in file if without not in line]
+        with open(filename, "w") as file:
+            file.writelines(lines)
+
+    saved_q = {
+        (event["pv_prefix"], event["timestamp"]): event["saved_loaded_q"]
+        for event in truth
+    }
+    return filename, truth, saved_q
+
+
+def test_replay_without_decay_reference(tmp_path):
+    filename, truth, saved_q = synth_dump(tmp_path, without="DECAYREFWF")
+
+    verdicts = replay_file(filename, saved_q)
+
+    assert [verdict["is_real"] for verdict in verdicts] == [
+        event["is_real"] for event in truth
+    ]
+    for verdict in verdicts:
+        assert verdict["decay_is_real"] is None
+        assert verdict["decay_rate_ratio"] is None
+
+
+def test_replay_without_fault_time(tmp_path):
+    filename, truth, saved_q = synth_dump(tmp_path, without="CAV:FLTTWF")
+
+    verdicts = replay_file(filename, saved_q)
+
+    assert len(verdicts) == len(truth)
+    for verdict in verdicts:
+        # nothing to fit, so never called fake
+        assert math.isnan(verdict["loaded_q"])
+        assert verdict["is_real"] is True
+
+
+@pytest.mark.parametrize("without", [None, "DECAYREFWF"])
+def test_replay_loaded_q_matches_truth(tmp_path, without):
+    filename, truth, saved_q = synth_dump(tmp_path, without=without)
+
+    verdicts = replay_file(filename, saved_q)
+
+    for verdict, event in zip(verdicts, truth):
+        assert verdict["pv_prefix"] == event["pv_prefix"]
+        assert verdict["loaded_q"] == pytest.approx(event["loaded_q"], rel=0.01)
+
+
+def test_replay_verdicts_match_truth(tmp_path):
+    filename, truth, saved_q = synth_dump(tmp_path)
+
+    verdicts = replay_file(filename, saved_q)
+
+    assert [verdict["is_real"] for verdict in verdicts] == [
+        event["is_real"] for event in truth
+    ]
+    assert [verdict["decay_is_real"] for verdict in verdicts] == [
+        event["is_real"] for event in truth
+    ]
+
+
+def test_recorded_saved_q_overrides_table(tmp_path):
+    filename, truth, saved_q = synth_dump(tmp_path)
+    with open(filename, "a") as file:
+        for event in truth:
+            file.write(
+                f"{event['pv_prefix']}:QLOADED {event['timestamp']} "
+                f"{event['saved_loaded_q']}\n"
+            )
+    # a table that would call every quench real
+    wrong_q = {key: 1e12 for key in saved_q}
+
+    verdicts = replay_file(filename, wrong_q)
+
+    for verdict, event in zip(verdicts, truth):
+        assert verdict["saved_loaded_q"] == event["saved_loaded_q"]
+        assert verdict["is_real"] == event["is_real"]
+
+
+def test_replay_without_saved_q_has_no_verdict(tmp_path):
+    filename, truth, _ = synth_dump(tmp_path)
+
+    verdicts = replay_file(filename)
+
+    assert len(verdicts) == len(truth)
+    for verdict in verdicts:
+        assert verdict["saved_loaded_q"] is None
+        assert verdict["threshold"] is None
+        assert verdict["is_real"] is None
+
+
+@pytest.mark.parametrize("threshold, expected", [(0.01, False), (10.0, True)])
+def test_threshold_changes_verdicts(tmp_path, threshold, expected):
+    filename, _, saved_q = synth_dump(tmp_path)
+
+    verdicts = replay_file(filename, saved_q, threshold=threshold)
+
+    assert all(verdict["is_real"] is expected for verdict in verdicts)
+
+
+def test_saved_q_from_truth_file(tmp_path):
+    filename, truth, _ = synth_dump(tmp_path)
+    truth_file = tmp_path / "truth.json"
+    truth_file.write_text(json.dumps(truth))
+    # records without a timestamp apply to every event of the cavity
+    per_cavity_file = tmp_path / "per_cavity.json"
+    per_cavity_file.write_text(
+        json.dumps(
+            [
+                {"pv_prefix": event["pv_prefix"], "saved_loaded_q": 1}
+                for event in truth
+            ]
+        )
+    )
+
+    saved_q = load_saved_q(str(truth_file))
+    per_cavity = load_saved_q(str(per_cavity_file))
+
+    assert saved_q == {
+        (event["pv_prefix"], event["timestamp"]): event["saved_loaded_q"]
+        for event in truth
+    }
+    assert per_cavity == {event["pv_prefix"]: 1.0 for event in truth}
+    assert load_saved_q(None) == {}
+    assert [verdict["is_real"] for verdict in replay_file(filename, saved_q)] == [
+        event["is_real"] for event in truth
+    ]
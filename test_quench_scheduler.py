@@ -0,0 +1,58 @@
+from quench_scheduler import QuenchAbortError, QuenchScheduler
+from quench_sim import SimCavity, SimDecarad
+
+
+class SnapshotCavity(SimCavity):
+    """
+    SimCavity reading its dose through max_raw_dose, like QuenchCavity does
+    from its monitor snapshot.
+    """
+
+    reads = 0
+    condition = None
+
+    @property
+    def max_raw_dose(self) -> float:
+        # the scheduler must not hold its condition across a dose read
+        assert not (self.condition and self.condition._is_owned())
+        SnapshotCavity.reads += 1
+        return 0.0
+
+
+def test_dose_read_through_cavity_outside_lock():
+    decarad = SimDecarad()
+    cavities = [SnapshotCavity(number, decarad, 100.0) for number in (1, 2)]
+    scheduler = QuenchScheduler(cavities, radiation_limit=1.0, step_spacing=0)
+    SnapshotCavity.condition = scheduler._condition
+
+    scheduler.wait_for_step(cavities[0])
+    scheduler.check_abort(cavities[1])
+
+    assert SnapshotCavity.reads == 2
+    # SimDecarad.max_raw_dose records the peak when it is read
+    assert decarad.peak_dose == 0.0
+
+
+class FailingCavity(SimCavity):
+    def quench_process(self, **kwargs):
+        raise RuntimeError("interlock fault")
+
+    def turn_off(self):
+        raise TimeoutError("RF off put timed out")
+
+
+def test_abort_leaves_no_flags_behind():
+    decarad = SimDecarad()
+    failing = FailingCavity(1, decarad, 100.0)
+    others = [SimCavity(number, decarad, 100.0) for number in (2, 3)]
+    scheduler = QuenchScheduler(
+        [failing] + others, max_concurrent=1, radiation_limit=1.0, step_spacing=0
+    )
+
+    results = scheduler.run(end_amp=11.0, step_time=0.001)
+
+    # the failed turn_off is reported, not raised out of run
+    assert isinstance(results[failing], RuntimeError)
+    for cavity in others:
+        assert isinstance(results[cavity], QuenchAbortError)
+    assert not any(cavity.abort_flag for cavity in [failing] + others)
@@ -0,0 +1,19 @@
+import os
+
+from quench_synth import write_dump
+from quench_watch import read_new_events
+
+
+def test_settled_file_keeps_last_line_without_newline(tmp_path):
+    filename = str(tmp_path / "dump_QUENCH.txt")
+    (truth,) = write_dump(filename, n_samples=64)
+    with open(filename, "rb+") as file:
+        file.truncate(os.path.getsize(filename) - 1)
+
+    assert read_new_events(filename, 0, settled=False) == ({}, 0)
+
+    events, offset = read_new_events(filename, 0, settled=True)
+    signals = events[(truth["pv_prefix"], truth["timestamp"])]
+    assert len(signals) == 5
+    assert all(len(data) == 64 for data in signals.values())
+    assert offset == os.path.getsize(filename)
@@ -0,0 +1,143 @@
+"""
+Offline checks of QuenchCavity.reset_quench against FakePVs.
+
+Cavity.__init__ needs a rack from a real Machine, so OfflineCavity sets up
+only the attributes the validation path reads. Skipped when the linac
+packages are not installed.
+"""
+
+import logging
+import time
+
+import pytest
+
+from quench_metrics import QuenchMetrics, timed_phase
+from quench_pv_fetch import FakePVBackend
+from quench_synth import synth_event
+
+SAVED_LOADED_Q = 4e7
+
+
+class FakeCryomodule:
+    logger = logging.getLogger("test_reset_quench")
+
+
+@pytest.fixture
+def linac_classes():
+    pytest.importorskip("lcls_tools")
+    pytest.importorskip("utils.sc_linac")
+    pytest.importorskip("applications.quench_processing")
+
+    from utils.sc_linac.cavity import Cavity
+    from validation_test import QuenchCavity
+
+    return Cavity, QuenchCavity
+
+
+def offline_cavity(quench_cavity_class, backend):
+    class OfflineCavity(quench_cavity_class):
+        frequency = 1.3e9
+
+        def __init__(self):
+            prefix = "ACCL:L1B:0210:"
+            self.fault_waveform_pv = prefix + "CAV:FLTAWF"
+            self.fault_time_waveform_pv = prefix + "CAV:FLTTWF"
+            self.decay_ref_pv = prefix + "DECAYREFWF"
+            self.current_q_loaded_pv = prefix + "QLOADED"
+            self.quench_latch_pv = prefix + "QUENCH_LTCH"
+            self._fault_waveform_pv_obj = None
+            self._fault_time_waveform_pv_obj = None
+            self._decay_ref_pv_obj = None
+            self._current_q_loaded_pv_obj = None
+            self._quench_latch_pv_obj = None
+
+            self.cryomodule = FakeCryomodule()
+            self.pre_quench_amp = None
+            self.monitor = None
+            self.metrics = QuenchMetrics()
+            self.scheduler = None
+            self.history = None
+
+        def __str__(self):
+            return "OfflineCavity"
+
+    cavity = OfflineCavity()
+    backend.attach(cavity)
+    return cavity
+
+
+def quenched_cavity(linac_classes, real, monkeypatch):
+    cavity_class, quench_cavity_class = linac_classes
+    backend = FakePVBackend()
+    cavity = offline_cavity(quench_cavity_class, backend)
+
+    resets = []
+    monkeypatch.setattr(
+        cavity_class, "reset_interlocks", lambda self, *a, **k: resets.append(self)
+    )
+
+    waveforms, _ = synth_event(n_samples=2048, saved_loaded_q=SAVED_LOADED_Q, real=real)
+    backend.set(cavity.quench_latch_pv, 1)
+    # the fault waveforms land after the latch
+    time.sleep(0.01)
+    backend.set(cavity.current_q_loaded_pv, SAVED_LOADED_Q)
+    backend.set(cavity.decay_ref_pv, waveforms["decay"])
+    backend.set(cavity.fault_time_waveform_pv, waveforms["time"])
+    backend.set(cavity.fault_waveform_pv, waveforms["cavity"])
+    return cavity, resets
+
+
+def test_fake_quench_is_reset(linac_classes, monkeypatch):
+    cavity, resets = quenched_cavity(linac_classes, False, monkeypatch)
+
+    assert cavity.reset_quench() is True
+    assert resets == [cavity]
+    assert cavity.metrics.counter(cavity, "fake_quench") == 1
+    assert cavity.metrics.histogram(cavity, "reset_quench").count == 1
+    assert cavity.metrics.histogram(cavity, "latch_to_reset_decision").count == 1
+
+
+def test_real_quench_is_not_reset(linac_classes, monkeypatch):
+    cavity, resets = quenched_cavity(linac_classes, True, monkeypatch)
+
+    assert cavity.reset_quench() is False
+    assert resets == []
+    assert cavity.metrics.counter(cavity, "real_quench") == 1
+
+
+def test_decay_scoring_failure_does_not_block_reset(linac_classes, monkeypatch):
+    import validation_test
+
+    def broken_score(*args, **kwargs):
+        raise ValueError("bad reference")
+
+    monkeypatch.setattr(validation_test, "score_decays", broken_score)
+    cavity, resets = quenched_cavity(linac_classes, False, monkeypatch)
+
+    assert cavity.reset_quench() is True
+    assert resets == [cavity]
+
+
+def test_history_failure_does_not_block_reset(linac_classes, monkeypatch):
+    class FullHistory:
+        def append(self, *args, **kwargs):
+            raise OSError("No space left on device")
+
+    cavity, resets = quenched_cavity(linac_classes, False, monkeypatch)
+    cavity.history = FullHistory()
+
+    assert cavity.reset_quench() is True
+    assert resets == [cavity]
+
+
+def test_timed_phase_keeps_return_value():
+    class Timed:
+        metrics = QuenchMetrics()
+
+        @timed_phase("work")
+        def work(self):
+            return 42
+
+    timed = Timed()
+    assert timed.work() == 42
+    assert timed.metrics.histogram(timed, "work").count == 1
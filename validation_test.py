@@ -1,5 +1,6 @@
 import datetime
 import time
+from contextlib import nullcontext
 from typing import Optional
 
 import numpy as np
@@ -18,15 +19,21 @@ from utils.sc_linac.cavity import Cavity
 from utils.sc_linac.decarad import Decarad
 from utils.sc_linac.linac_utils import QuenchError, RF_MODE_SELA
 
-################# NEW CODE SECTION #######################
-from quench_waveform_v2 import cavity_data
-time_range = time_range = list(range(len(cavity_data)))
-
-from utils.sc_linac.linac import Machine
-from applications.quench_processing.quench_cryomodule import QuenchCryomodule
+from quench_decay import is_real_by_decay, score_decays
+from quench_fit import fit_loaded_q, fit_loaded_q_batch, is_real_quench
+from quench_history import QuenchHistory
+from quench_metrics import QuenchMetrics, shared_metrics, timed_phase
+from quench_monitor import (
+    FAST_PV_MAX_AGE,
+    LATCH_CLEAR_TIMEOUT,
+    SLOW_PV_MAX_AGE,
+    QuenchMonitor,
+    shared_monitor,
+)
+from quench_pv_fetch import fetch_fault_data
+from quench_ramp import AdaptiveRamp
+from quench_scheduler import QuenchScheduler
 
-from utils.sc_linac.cryomodule import Cryomodule
-##########################################################
 
 class QuenchCavity(Cavity):
     def __init__(
@@ -43,17 +50,69 @@ class QuenchCavity(Cavity):
         self._fault_waveform_pv_obj: Optional[PV] = None
 
         self.decay_ref_pv = self.pv_addr("DECAYREFWF")
+        self._decay_ref_pv_obj: Optional[PV] = None
 
         self.fault_time_waveform_pv = self.pv_addr("CAV:FLTTWF")
         self._fault_time_waveform_pv_obj: Optional[PV] = None
 
         self.srf_max_pv = self.pv_addr("ADES_MAX_SRF")
         self.pre_quench_amp = None
+        # ADES when quench_process last detected a quench
+        self.last_quench_amp: Optional[float] = None
         self._quench_bypass_rbck_pv: Optional[PV] = None
         self._current_q_loaded_pv_obj: Optional[PV] = None
 
         self.decarad: Optional[Decarad] = None
 
+        # set by use_monitor to have PV changes pushed instead of polled
+        self.monitor: Optional[QuenchMonitor] = None
+
+        # phase timings and counters, shared by every cavity unless replaced
+        self.metrics: QuenchMetrics = shared_metrics()
+
+        # set while a QuenchScheduler is processing this cavity with others
+        self.scheduler: Optional[QuenchScheduler] = None
+
+        # set to keep every validated quench (and its waveforms) for trending
+        self.history: Optional[QuenchHistory] = None
+
+    def use_monitor(self, monitor: Optional[QuenchMonitor] = None):
+        """
+        Switch the wait loops from 1s polling to pushed updates of the quench
+        latch, amplitude and decarad doses, and have check_abort read cavity
+        and decarad state from the monitor's snapshot instead of the IOC.
+        Every cavity shares the same monitor (and dispatcher thread) unless
+        one is passed in.
+        """
+        self.monitor = monitor or shared_monitor()
+        self.monitor.subscribe(self.quench_latch_pv_obj, self)
+        self.monitor.subscribe(self.aact_pv_obj, self)
+        self.monitor.subscribe(self.ades_pv_obj, self)
+        self.monitor.subscribe(self.rf_state_pv_obj, self)
+        self.monitor.subscribe(self.rf_mode_pv_obj, self)
+        for head in self.decarad.heads.values():
+            self.monitor.subscribe(head.raw_dose_pv_obj, self)
+
+    def snapshot(self, pv_obj: PV, max_age: float = FAST_PV_MAX_AGE):
+        """
+        Value of pv_obj from the monitor if it is fresh enough, else read.
+        """
+        if self.monitor:
+            return self.monitor.get(pv_obj, max_age)
+        return pv_obj.get()
+
+    @property
+    def max_raw_dose(self) -> float:
+        return max(
+            self.snapshot(head.raw_dose_pv_obj) for head in self.decarad.heads.values()
+        )
+
+    @property
+    def is_quenched(self) -> bool:
+        if self.monitor and self.monitor.has_value(self.quench_latch_pv):
+            return self.monitor.value(self.quench_latch_pv) == 1
+        return super().is_quenched
+
     @property
     def current_q_loaded_pv_obj(self):
         if not self._current_q_loaded_pv_obj:
@@ -82,6 +141,12 @@ class QuenchCavity(Cavity):
             self._fault_waveform_pv_obj = PV(self.fault_waveform_pv)
         return self._fault_waveform_pv_obj
 
+    @property
+    def decay_ref_pv_obj(self) -> PV:
+        if not self._decay_ref_pv_obj:
+            self._decay_ref_pv_obj = PV(self.decay_ref_pv)
+        return self._decay_ref_pv_obj
+
     @property
     def fault_time_waveform_pv_obj(self) -> PV:
         if not self._fault_time_waveform_pv_obj:
@@ -96,22 +161,61 @@ class QuenchCavity(Cavity):
             self._interlock_reset_pv_obj = PV(self.interlock_reset_pv)
 
         self._interlock_reset_pv_obj.put(1)
+
+        if self.monitor:
+            # the pushed latch value lags the reset slightly, don't mistake it
+            # for a new quench
+            self.monitor.wait_until(
+                self, lambda: not self.is_quenched, LATCH_CLEAR_TIMEOUT
+            )
+
         self.wait_for_decarads()
 
+    @timed_phase("walk_to_quench")
     def walk_to_quench(
         self,
         end_amp: float = 21,
         step_size: float = 0.2,
         step_time: float = 30,
+        adaptive: bool = False,
     ):
+        """
+        :param adaptive: take larger, shorter steps while far from the last
+            quench amplitude and radiation is quiet, step_size/step_time near it
+        """
+        ramp = None
+        if adaptive:
+            ramp = AdaptiveRamp(
+                step_size,
+                step_time,
+                radiation_limit=RADIATION_LIMIT,
+                ades_max=self.ades_max,
+            )
+
         self.reset_interlocks()
         while not self.is_quenched and self.ades < end_amp:
             self.check_abort()
+            if self.scheduler:
+                # holds while neighbours settle or the shared dose is high
+                self.scheduler.wait_for_step(self)
+            if ramp:
+                step_size, step_time = ramp.next_step(
+                    self.ades,
+                    end_amp,
+                    self.max_raw_dose,
+                    self.last_quench_amp or self.pre_quench_amp,
+                )
             self.ades = min(self.ades + step_size, end_amp)
             self.wait(step_time - DECARAD_SETTLE_TIME)
             self.wait_for_decarads()
 
     def wait(self, seconds: float):
+        if self.monitor:
+            self.monitor.wait_until(
+                self, lambda: self.is_quenched, seconds, on_wake=self.check_abort
+            )
+            return
+
         for _ in range(int(seconds)):
             self.check_abort()
             time.sleep(1)
@@ -119,6 +223,7 @@ class QuenchCavity(Cavity):
                 return
         time.sleep(seconds - int(seconds))
 
+    @timed_phase("wait_for_quench")
     def wait_for_quench(self, time_to_wait=MAX_WAIT_TIME_FOR_QUENCH) -> Optional[float]:
         # wait 1s before resetting just in case
         time.sleep(1)
@@ -126,6 +231,12 @@ class QuenchCavity(Cavity):
         time_start = datetime.datetime.now()
         print(f"{datetime.datetime.now()} Waiting {time_to_wait}s for {self} to quench")
 
+        if self.monitor:
+            self.monitor.wait_until(
+                self, lambda: self.is_quenched, time_to_wait, on_wake=self.check_abort
+            )
+            return (datetime.datetime.now() - time_start).total_seconds()
+
         while (
             not self.is_quenched
             and (datetime.datetime.now() - time_start).total_seconds() < time_to_wait
@@ -142,33 +253,58 @@ class QuenchCavity(Cavity):
             print(
                 f"Detected {self} quench, waiting {DECARAD_SETTLE_TIME}s for decarads to settle"
             )
-            start = datetime.datetime.now()
-            while (
-                datetime.datetime.now() - start
-            ).total_seconds() < DECARAD_SETTLE_TIME:
-                super().check_abort()
-                time.sleep(1)
+            settling = (
+                self.scheduler.settling(self) if self.scheduler else nullcontext()
+            )
+            with settling, self.metrics.time(self, "decarad_settle"):
+                if self.monitor:
+                    self.monitor.wait_until(
+                        self,
+                        lambda: False,
+                        DECARAD_SETTLE_TIME,
+                        on_wake=super().check_abort,
+                    )
+                    return
+
+                start = datetime.datetime.now()
+                while (
+                    datetime.datetime.now() - start
+                ).total_seconds() < DECARAD_SETTLE_TIME:
+                    super().check_abort()
+                    time.sleep(1)
 
     def check_abort(self):
         super().check_abort()
-        if self.decarad.max_raw_dose > RADIATION_LIMIT:
+        if self.scheduler:
+            self.scheduler.check_abort(self)
+        if self.max_raw_dose > RADIATION_LIMIT:
             raise QuenchError("Max Radiation Dose Exceeded")
         if self.has_uncaught_quench():
             raise QuenchError("Potential uncaught quench detected")
 
     def has_uncaught_quench(self) -> bool:
-        return (
-            self.is_on
-            and self.rf_mode == RF_MODE_SELA
-            and self.aact <= QUENCH_AMP_THRESHOLD * self.ades
+        # runs every second per cavity, so reads come from the snapshot
+        amplitude_dropped = (
+            self.snapshot(self.rf_state_pv_obj, SLOW_PV_MAX_AGE) == 1
+            and self.snapshot(self.rf_mode_pv_obj, SLOW_PV_MAX_AGE) == RF_MODE_SELA
+            and self.snapshot(self.aact_pv_obj)
+            <= QUENCH_AMP_THRESHOLD * self.snapshot(self.ades_pv_obj, SLOW_PV_MAX_AGE)
         )
+        if not amplitude_dropped:
+            return False
 
+        # a latched quench is caught. Read the latch fresh, since its pushed
+        # update can arrive after the amplitude one
+        return self.snapshot(self.quench_latch_pv_obj, max_age=0) != 1
+
+    @timed_phase("quench_process")
     def quench_process(
         self,
         start_amp: float = 5,
         end_amp: float = 21,
         step_size: float = 0.2,
         step_time: float = 30,
+        adaptive: bool = False,
     ):
         self.turn_off()
         self.set_sela_mode()
@@ -190,11 +326,14 @@ class QuenchCavity(Cavity):
                 end_amp=end_amp,
                 step_size=step_size,
                 step_time=step_time if not quenched else 3 * 60,
+                adaptive=adaptive,
             )
 
             if self.is_quenched:
                 quenched = True
+                self.last_quench_amp = self.ades
                 print(f"{datetime.datetime.now()} Detected quench for {self}")
+                self.metrics.increment(self, "quench_detected")
                 attempt = 0
                 running_times = []
                 time_to_quench = self.wait_for_quench()
@@ -210,6 +349,7 @@ class QuenchCavity(Cavity):
                     time_to_quench = self.wait_for_quench()
                     running_times.append(time_to_quench)
                     attempt += 1
+                    self.metrics.increment(self, "quench_retry")
 
                 if (
                     attempt
@@ -218,6 +358,7 @@ class QuenchCavity(Cavity):
                 ):
                     print(f"Attempt: {attempt}")
                     print(f"Running times: {running_times}")
+                    self.metrics.increment(self, "quench_process_failed")
                     raise QuenchError("Quench processing failed")
 
         while (
@@ -229,6 +370,7 @@ class QuenchCavity(Cavity):
             )
             super().check_abort()
 
+    @timed_phase("validate_quench")
     def validate_quench(self, wait_for_update: bool = False):
         """
         Parsing the fault waveforms to calculate the loaded Q to try to determine
@@ -247,61 +389,101 @@ class QuenchCavity(Cavity):
         :return: bool representing whether quench was real
         """
 
-        if wait_for_update:
-            print(f"Waiting 0.1s to give {self} waveforms a chance to update")
-            time.sleep(0.1)
-
-        # ORIGINAL CODE
-        time_data = self.fault_time_waveform_pv_obj.get()
-        fault_data = self.fault_waveform_pv_obj.get()
-        time_0 = 0
-        
-        ################### NEW CODE SECTION #######################
-        # time_data = time_range
-        # fault_data = cavity_data
-        # time_0 = 0
-        ############################################################
-
-        # Look for time 0 (quench). These waveforms capture data beforehand
-        for time_0, timestamp in enumerate(time_data):
-            if timestamp >= 0:
-                break
-
-        fault_data = fault_data[time_0:]
-        time_data = time_data[time_0:]
-
-        end_decay = len(fault_data) - 1
-
-        # Find where the amplitude decays to "zero"
-        for end_decay, amp in enumerate(fault_data):
-            if amp < 0.002:
-                break
-
-        fault_data = fault_data[:end_decay]
-        time_data = time_data[:end_decay]
-
-        saved_loaded_q = self.current_q_loaded_pv_obj.get()
+        # waits for the fault waveforms to be newer than the quench latch
+        # instead of sleeping a fixed time
+        with self.metrics.time(self, "pv_read"):
+            ((time_data, fault_data, saved_loaded_q, decay_ref),) = fetch_fault_data(
+                [self], wait_for_update=wait_for_update
+            )
 
-        self.pre_quench_amp = fault_data[0]
+        # recorded waveforms are run through the same fit and verdict offline
+        # with quench_replay.py instead of being swapped in here by hand
 
-        exponential_term = np.polyfit(
-            time_data, np.log(self.pre_quench_amp / fault_data), 1
-        )[0]
-        loaded_q = (np.pi * self.frequency) / exponential_term
+        # finds time 0 and the end of the decay on the arrays directly and
+        # fits the slope in closed form
+        with self.metrics.time(self, "fit"):
+            loaded_q, self.pre_quench_amp = fit_loaded_q(
+                time_data, fault_data, self.frequency
+            )
 
         thresh_for_quench = LOADED_Q_CHANGE_FOR_QUENCH * saved_loaded_q
         self.cryomodule.logger.info(f"{self} Saved Loaded Q: {saved_loaded_q:.2e}")
-        self.cryomodule.logger.info(f"{self} Last recorded amplitude: {fault_data[0]}")
+        self.cryomodule.logger.info(
+            f"{self} Last recorded amplitude: {self.pre_quench_amp}"
+        )
         self.cryomodule.logger.info(f"{self} Threshold: {thresh_for_quench:.2e}")
         self.cryomodule.logger.info(f"{self} Calculated Loaded Q: {loaded_q:.2e}")
 
-        is_real = loaded_q < thresh_for_quench
+        is_real = bool(
+            is_real_quench(loaded_q, saved_loaded_q, LOADED_Q_CHANGE_FOR_QUENCH)
+        )
         print("Validation: ", is_real)
 
+        # second opinion from the shape of the decay against the normal one,
+        # logged only, the loaded Q verdict decides
+        if decay_ref is not None and len(decay_ref):
+            try:
+                scores = score_decays([time_data], [fault_data], [decay_ref])
+                decay_is_real = bool(
+                    is_real_by_decay(
+                        scores["rate_ratio"][0], LOADED_Q_CHANGE_FOR_QUENCH
+                    )
+                )
+                self.cryomodule.logger.info(
+                    f"{self} Decay vs reference: "
+                    f"rate ratio {scores['rate_ratio'][0]:.2f}, "
+                    f"residual {scores['residual'][0]:.3f}, "
+                    f"correlation {scores['correlation'][0]:.3f}"
+                )
+                if decay_is_real != is_real:
+                    self.cryomodule.logger.warning(
+                        f"{self} Decay reference says "
+                        f"{'REAL' if decay_is_real else 'FAKE'}, "
+                        f"loaded Q says {'REAL' if is_real else 'FAKE'}"
+                    )
+            except Exception as e:
+                self.cryomodule.logger.warning(
+                    f"{self} Could not score decay against reference: {e}"
+                )
+
+        if self.history:
+            # a full disk or locked store must not keep the quench from being reset
+            try:
+                self.history.append(
+                    self,
+                    loaded_q,
+                    saved_loaded_q,
+                    thresh_for_quench,
+                    self.pre_quench_amp,
+                    is_real,
+                    time_data,
+                    fault_data,
+                )
+            except Exception as e:
+                self.cryomodule.logger.warning(
+                    f"{self} Could not record quench in history: {e}"
+                )
+
         return is_real
 
+    @property
+    def quench_latch_timestamp(self) -> Optional[float]:
+        if self.monitor and self.monitor.has_value(self.quench_latch_pv):
+            return self.monitor.timestamp(self.quench_latch_pv)
+        return self.quench_latch_pv_obj.timestamp
+
+    @timed_phase("reset_quench")
     def reset_quench(self) -> bool:
+        latch_timestamp = self.quench_latch_timestamp
         is_real = self.validate_quench(wait_for_update=True)
+
+        # how long the cavity sat latched before we decided what to do with it
+        if latch_timestamp:
+            self.metrics.observe(
+                self, "latch_to_reset_decision", time.time() - latch_timestamp
+            )
+        self.metrics.increment(self, "real_quench" if is_real else "fake_quench")
+
         if not is_real:
             self.cryomodule.logger.info(f"{self} FAKE quench detected, resetting")
             super().reset_interlocks()
@@ -313,16 +495,114 @@ class QuenchCavity(Cavity):
             )
             return False
         
-# # printing results
-# cannot use this method because cavity objects are not meant to be used in isolation
-# if __name__ == "__main__":
-#     test_cavity = QuenchCavity(cavity_num=" " , rack_object=" ")
-#     result = test_cavity.validate_quench()
-#     print("Is it a real quench?", result)
-
-machine_variable = Machine(cavity_class=QuenchCavity, cryomodule_class=QuenchCryomodule)
-results_1 = machine_variable.cryomodules["03"].cavities[6]
-
-print("\nRESULTS: ", results_1) # prints the section, cryomodule, and cavity numbers
-results_2 = results_1.validate_quench()
-print("Is it a real quench?", results_2)
\ No newline at end of file
+
+def quench_cavities(scl_object) -> list:
+    """
+    Collect the cavities of a cryomodule, a linac or the whole machine.
+    """
+    if hasattr(scl_object, "cavities"):
+        return list(scl_object.cavities.values())
+    return [
+        cavity
+        for cryomodule in scl_object.cryomodules.values()
+        for cavity in cryomodule.cavities.values()
+    ]
+
+
+def validate_quenches(scl_object, wait_for_update: bool = False) -> dict:
+    """
+    Batched version of QuenchCavity.validate_quench for every cavity under a
+    cryomodule, linac or the whole machine. All the fault waveforms are read
+    concurrently and fit together with fit_loaded_q_batch.
+
+    :param scl_object: QuenchCryomodule, Linac or Machine
+    :param wait_for_update: bool
+    :return: dict of cavity -> (loaded_q, pre_quench_amp, is_real)
+    """
+    cavities = quench_cavities(scl_object)
+    if not cavities:
+        return {}
+
+    metrics = shared_metrics()
+
+    # every cavity's reads go out concurrently
+    with metrics.time(None, "batch_pv_read"):
+        time_waveforms, fault_waveforms, saved_loaded_qs, _ = zip(
+            *fetch_fault_data(cavities, wait_for_update=wait_for_update)
+        )
+    saved_loaded_qs = np.array(saved_loaded_qs, dtype=float)
+
+    with metrics.time(None, "batch_fit"):
+        loaded_qs, pre_quench_amps = fit_loaded_q_batch(
+            time_waveforms, fault_waveforms, [cavity.frequency for cavity in cavities]
+        )
+    thresholds = LOADED_Q_CHANGE_FOR_QUENCH * saved_loaded_qs
+
+    # a cavity whose decay could not be fit is never called fake
+    is_real = is_real_quench(loaded_qs, saved_loaded_qs, LOADED_Q_CHANGE_FOR_QUENCH)
+
+    results = {}
+    for idx, cavity in enumerate(cavities):
+        cavity.pre_quench_amp = pre_quench_amps[idx]
+        cavity.cryomodule.logger.info(
+            f"{cavity} Saved Loaded Q: {saved_loaded_qs[idx]:.2e}, "
+            f"Threshold: {thresholds[idx]:.2e}, "
+            f"Calculated Loaded Q: {loaded_qs[idx]:.2e}"
+        )
+        results[cavity] = (loaded_qs[idx], pre_quench_amps[idx], bool(is_real[idx]))
+
+        if cavity.history:
+            try:
+                cavity.history.append(
+                    cavity,
+                    loaded_qs[idx],
+                    saved_loaded_qs[idx],
+                    thresholds[idx],
+                    pre_quench_amps[idx],
+                    is_real[idx],
+                    time_waveforms[idx],
+                    fault_waveforms[idx],
+                )
+            except Exception as e:
+                cavity.cryomodule.logger.warning(
+                    f"{cavity} Could not record quench in history: {e}"
+                )
+
+    return results
+
+
+def quench_process_cryomodule(
+    cryomodule, cavity_numbers=None, max_concurrent=None, **kwargs
+) -> dict:
+    """
+    Run quench_process on several cavities of a cryomodule at once, sharing
+    one radiation budget and abort path.
+
+    :param cavity_numbers: cavities to process, all of them by default
+    :param max_concurrent: cavities processed at the same time
+    :param kwargs: passed to quench_process
+    :return: dict of cavity -> None if it finished, else the exception
+    """
+    cavities = [
+        cavity
+        for number, cavity in cryomodule.cavities.items()
+        if cavity_numbers is None or number in cavity_numbers
+    ]
+    scheduler = QuenchScheduler(
+        cavities, max_concurrent=max_concurrent, radiation_limit=RADIATION_LIMIT
+    )
+    return scheduler.run(**kwargs)
+
+
+if __name__ == "__main__":
+    # only builds CM03 instead of the whole machine
+    from quench_machine import quench_cavity
+
+    results_1 = quench_cavity("03", 6, cavity_class=QuenchCavity)
+
+    print("\nRESULTS: ", results_1) # prints the section, cryomodule, and cavity numbers
+    results_2 = results_1.validate_quench()
+    print("Is it a real quench?", results_2)
+
+    # where the time went
+    print(shared_metrics().summary())
\ No newline at end of file